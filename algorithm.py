@@ -0,0 +1,663 @@
+import cv2
+import numpy as np
+from enum import Enum
+from PIL import Image
+from masks import PackedMask
+
+class OutlineColor(Enum):
+    """
+    边界线颜色，用于提取轮廓线
+    """
+    red = 1
+    orange = 2
+    yellow = 3
+    green = 4
+    cyan = 5
+    blue = 6
+    purple = 7
+    black = 8
+    gray = 9
+    white = 10
+
+Zhcn2ColorDict = {
+    '红色': 'red',
+    '橙色': 'orange',
+    '黄色': 'yellow',
+    '绿色': 'green',
+    '青色': 'cyan',
+    '蓝色': 'blue',
+    '紫色': 'purple',
+    '黑色': 'black',
+    '白色': 'gray',
+    '灰色': 'white',
+}
+
+# 颜色范围字典，用于确定取色结果属于哪种颜色((颜色下界), (颜色上界))、
+colorScopeDict = {'red_1': ((0, 43, 46), (10, 255, 255)), 
+             'red_2': ((156, 43, 46), (180, 255, 255)),
+             'orange': ((11, 43, 46), (25, 255, 255)),
+             'yellow': ((26, 43, 46), (34, 255, 255)),
+             'green': ((35, 43, 46), (77, 255, 255)),
+             'cyan': ((78, 43, 46), (99, 255, 255)),
+             'blue': ((100, 43, 46), (124, 255, 255)),
+             'purple': ((125, 43, 46), (155, 255, 255)),
+             'black': ((0, 0, 0), (180, 255, 46)),
+             'gray': ((0, 0, 46), (180, 43, 220)),
+             'white': ((0, 0, 221), (180, 30, 255)),
+            }
+
+# 颜色字典，用于绘制线条，轴线显示等
+colorDict = {'红色': (255, 0, 0),
+             '橙色': (255, 165, 0),
+             '黄色': (255, 255, 0),
+             '绿色': (127, 255, 0),
+             '青色': (0, 255, 255),
+             '蓝色': (30, 144, 255),
+             '紫色': (160, 32, 240),
+             '黑色': (0, 0, 0),
+             '灰色': (192, 192, 192),
+             '白色': (255, 255, 255),
+}
+
+# 颜色查找表，hsv三个通道各一张，第一次使用时生成
+_colorLUT = None
+
+def colorBit(outlineColor):
+    """
+    颜色在位标记中对应的位
+    """
+    return 1 << (outlineColor.value - 1)
+
+def getColorLUT():
+    """
+    生成h、s、v三个通道的颜色查找表，每个通道值对应一个位标记，标记该值落在哪些颜色的范围内
+
+    每种颜色的范围都是hsv空间中的长方体(红色的两段只有h不同)，因此像素所属的颜色为三个通道标记的交集；
+    各颜色范围之间有重叠(如V=46既属于黑色也属于红色)，因此用位标记而不是单一类别
+
+    Return
+    ------
+    lut: ndarray
+        (2, 1, 256, 3) uint8，分别为位标记的低8位和高8位，可以直接用于cv2.LUT
+    """
+    global _colorLUT
+    if _colorLUT is None:
+        lut = np.zeros((256, 3), dtype=np.uint16)
+        values = np.arange(256)
+        for color in OutlineColor:
+            names = ['red_1', 'red_2'] if color == OutlineColor.red else [color.name]
+            for name in names:
+                lower, upper = colorScopeDict[name]
+                for channel in range(3):
+                    inRange = (values >= lower[channel]) & (values <= upper[channel])
+                    lut[inRange, channel] |= colorBit(color)
+        _colorLUT = np.stack([lut & 255, lut >> 8]).astype(np.uint8).reshape(2, 1, 256, 3)
+    return _colorLUT
+
+def _lookupColorBits(im_hsv, byte):
+    """
+    查表得到位标记的低8位(byte=0)或高8位(byte=1)
+    """
+    h, s, v = cv2.split(cv2.LUT(im_hsv, getColorLUT()[byte]))
+    cv2.bitwise_and(h, s, dst=h)
+    cv2.bitwise_and(h, v, dst=h)
+    return h
+
+def classifyColors(image):
+    """
+    一次hsv转换和查表，得到每个像素属于哪些边界线颜色
+
+    Parameters
+    ----------
+    image: ndarray
+        rgb图像
+
+    Return
+    ------
+    result: ndarray
+        uint16位标记图，第(color.value - 1)位为1表示像素属于该颜色，见colorBit
+    """
+    im_hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
+    result = _lookupColorBits(im_hsv, 1).astype(np.uint16)
+    result <<= 8
+    result |= _lookupColorBits(im_hsv, 0)
+    return result
+
+def getOutlineMasks(image, outlineColors):
+    """
+    一次hsv转换和查表，提取多种颜色的轮廓线
+
+    Parameters
+    ----------
+    image: ndarray
+        带有边界线的图像
+    outlineColors: list
+        轮廓线颜色列表
+
+    Return
+    ------
+    result: dict
+        {颜色: 轮廓线掩膜}，掩膜与getOutlineMask相同
+    """
+    im_hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
+    colorBits = {}
+    result = {}
+    for color in outlineColors:
+        byte, bit = divmod(color.value - 1, 8)
+        # 只查找需要的字节
+        if byte not in colorBits:
+            colorBits[byte] = _lookupColorBits(im_hsv, byte)
+        mask = cv2.bitwise_and(colorBits[byte], 1 << bit)
+        result[color] = np.right_shift(mask, bit, out=mask)
+    return result
+
+def getOutlineMask(image, outlineColor):
+    """
+    根据轮廓线的颜色，提取出轮廓
+
+    Parameters
+    ----------
+    image: ndarray
+        带有边界线的图像
+    outlineColor: enum
+        轮廓线线的颜色
+
+    Return
+    ------
+    result: ndarray
+        轮廓线掩膜，单通道图像，线条位置为1，背景为0
+    """
+    return getOutlineMasks(image, [outlineColor])[outlineColor]
+
+def image_blend(image, areaMask, alpha, beta, gamma) -> Image:
+    """
+    将图片内的前背景按一定比例区分
+
+    Parameters
+    ----------
+    image: ndarray
+    areaMask: ndarray
+        区域掩膜
+    alpha: float
+        前景区的融合比例
+    beta: float
+        背景区的融合比例
+    gamma: 透明度
+
+    Return
+    ------
+    result: ndarray
+        融合后的结果
+    """
+    foreground = image
+    background = image.copy()
+    # 如果掩膜是单通道图像，先将其转为三通道
+    if len(areaMask.shape) == 2:
+        for i in range(3):
+            foreground[:, :, i][areaMask == 0] = 0
+            background[:, :, i][areaMask > 0] = 0
+    result = cv2.addWeighted(foreground, alpha, background, beta, gamma)
+    return result
+
+def img_addition(image, areaMask, axisColor):
+    """
+    为图片内掩膜区域上色
+
+    Parameters
+    ----------
+    image: ndarray
+    areaMask: ndarray
+        区域掩膜
+    axisColor: tuple
+        颜色，(r, g, b)
+
+    Return
+    ------
+    image: ndarray
+    """
+    image[:, :, 0][areaMask > 0] = axisColor[0]
+    image[:, :, 1][areaMask > 0] = axisColor[1]
+    image[:, :, 2][areaMask > 0] = axisColor[2]
+    return image
+
+def dilate_iter(image, villageMask, iter_num: int, kernelSize, line_width):
+    """
+    骨架线逐步膨胀的动态显示帧，依次为 村落掩膜、膨胀iter_num次 ... 膨胀1次、按轴线宽度膨胀的骨架线
+
+    只计算一次骨架线的棋盘距离变换，第k帧即距离不超过k倍核半径且在村落内的区域，
+    每帧只需一次阈值比较，按需逐帧生成，不保存中间结果
+
+    Parameters
+    ----------
+    image: ndarray
+        骨架图，骨架位置大于0
+    villageMask: ndarray
+        村落掩膜
+    iter_num: int
+        膨胀次数
+    kernelSize: int
+        每次膨胀的核大小，每次向四周各扩展 (kernelSize-1)//2 个像素；
+        偶数核与原先的kernelSize x kernelSize方形核膨胀不同：方形核以中心为锚点，
+        左上方扩展kernelSize//2、右下方扩展kernelSize//2-1，这里四周都扩展kernelSize//2-1
+        (如核大小8时原先为4/3个像素，这里为3/3个像素)
+    line_width: int
+        轴线宽度
+
+    Return
+    ------
+    generator of ndarray
+        各帧的区域掩膜
+    """
+    skeleton = np.asarray(image) > 0
+    villageMask = np.asarray(villageMask)
+    yield villageMask
+    # 到最近骨架像素的棋盘距离，与方形核膨胀的范围一致，村落以外的像素不会被选中
+    distance = cv2.distanceTransform((~skeleton).astype(np.uint8), cv2.DIST_C, 3)
+    distance[villageMask == 0] = np.inf
+    radius = (kernelSize - 1) // 2
+    for i in range(iter_num, 0, -1):
+        yield np.less_equal(distance, i * radius).view(np.uint8)
+    kernel = np.ones((line_width, line_width), np.uint8)
+    yield cv2.dilate(skeleton.astype(np.uint8), kernel, iterations=1)
+
+def cal_slope(image, grad_we, grad_sn):
+    """
+    计算一张图片的坡度，使用三阶不带权差分法计算坡度
+
+    边缘使用复制边界的方式处理，不再额外填充图像；全程使用float32并原地计算
+
+    Parameters
+    ----------
+    img_array: ndarray
+    grad_we: float
+        dem格网宽度，每像素代表的距离（单位：米)
+    grad_sn: float
+        dem格网高度，每像素代表的距离（单位：米）
+    
+    Return
+    ------
+    slope: ndarray
+        坡度图，float32
+    """
+    # 将差分的系数1/8和格网大小合并到卷积核中
+    kernal_we = np.array([[1, 0, -1],
+                          [2, 0, -2],
+                          [1, 0, -1]], dtype=np.float32) / (8 * grad_we)
+    kernal_sn = np.array([[-1,-2,-1],
+                          [0, 0, 0],
+                          [1, 2, 1]], dtype=np.float32) / (8 * grad_sn)
+    img = np.asarray(image, dtype=np.float32)
+    slope_we = cv2.filter2D(img, cv2.CV_32F, kernal_we, borderType=cv2.BORDER_REPLICATE)
+    slope_sn = cv2.filter2D(img, cv2.CV_32F, kernal_sn, borderType=cv2.BORDER_REPLICATE)
+    # sqrt(we^2 + sn^2)
+    slope = cv2.magnitude(slope_we, slope_sn, slope_we)
+    np.arctan(slope, out=slope)
+    slope *= 57.29578
+    return slope
+
+def cal_slope_blocks(image, grad_we, grad_sn, out=None, blockRows=1024, progress=None):
+    """
+    按行分块计算坡度，每块上下各多读取一行，峰值内存只与分块大小有关，适用于内存映射的大幅dem
+
+    Parameters
+    ----------
+    image: ndarray or np.memmap
+        dem
+    grad_we, grad_sn: float
+        dem格网宽度和高度（单位：米）
+    out: ndarray or np.memmap, optional
+        float32输出数组，为None时新建
+    blockRows: int
+        每块的行数
+    progress: callable, optional
+        progress(已完成的行数, 总行数)，每块调用一次，可以抛出异常中止计算
+
+    Return
+    ------
+    out: ndarray
+        坡度图，与cal_slope的结果相同
+    """
+    height = image.shape[0]
+    if out is None:
+        out = np.empty(image.shape, dtype=np.float32)
+    for r0 in range(0, height, blockRows):
+        r1 = min(r0 + blockRows, height)
+        h0, h1 = max(r0 - 1, 0), min(r1 + 1, height)
+        slope = cal_slope(image[h0:h1], grad_we, grad_sn)
+        out[r0:r1] = slope[r0 - h0:r1 - h0]
+        if progress is not None:
+            progress(r1, height)
+    return out
+
+class ThresholdMask(object):
+    """
+    阈值掩膜(值小于阈值的区域为1)，栅格只排序一次，阈值改变时只翻转新旧阈值之间的像素，
+    融合图像也只重绘这些像素；掩膜按位压缩保存
+    """
+    def __init__(self, values) -> None:
+        """
+        Parameters
+        ----------
+        values: ndarray
+            (h, w) 栅格，如坡度图，nan不会被选中
+        """
+        flat = np.asarray(values, dtype=np.float32).ravel()
+        order = np.argsort(flat, kind='stable')
+        self.order = order.astype(np.int32) if flat.size < 2**31 else order
+        self.sortedValues = flat[order]
+        self.mask = PackedMask.zeros(values.shape[:2])
+        self.threshold = -np.inf
+        self._blendSource = None        # 融合图像的原图
+        self._blendParams = None
+        # 融合图像交替使用两个缓冲区，刚返回(可能正在显示)的缓冲区在下一次融合时不被修改
+        self._buffers = [None, None]
+        self._bufferThresholds = [None, None]   # 各缓冲区对应的阈值
+        self._front = 1
+        self.blendChanged = None    # 最近一次融合中被修改的像素的一维索引，整幅重新融合时为None
+
+    def _between(self, t0, t1):
+        """
+        值介于两个阈值之间的像素的一维索引
+        """
+        lo, hi = np.searchsorted(self.sortedValues, sorted((t0, t1)), side='left')
+        return self.order[lo:hi]
+
+    def update(self, threshold):
+        """
+        修改阈值，原地更新掩膜
+
+        Return
+        ------
+        index: ndarray
+            发生变化的像素的一维索引
+        """
+        index = self._between(self.threshold, threshold)
+        # 一维索引 -> 压缩后的字节位置与位
+        rows, columns = np.divmod(index, self.mask.width)
+        byteIndex = rows * self.mask.packed.shape[1] + columns // 8
+        bits = np.right_shift(0x80, columns % 8).astype(np.uint8)
+        packed = self.mask.packed.reshape(-1)
+        if threshold > self.threshold:
+            np.bitwise_or.at(packed, byteIndex, bits)
+        else:
+            np.bitwise_and.at(packed, byteIndex, ~bits)
+        self.threshold = threshold
+        return index
+
+    def select(self, threshold):
+        """
+        修改阈值，返回原地更新后的掩膜(PackedMask)
+        """
+        self.update(threshold)
+        return self.mask
+
+    def blend(self, image, alpha, beta, gamma):
+        """
+        与image_blend的结果相同，原图和融合参数不变时只重绘变化的像素
+
+        两个缓冲区交替使用：每次融合写入上一次没有返回的缓冲区，只重绘该缓冲区上次融合之后
+        发生变化的像素(记录在blendChanged中)，上一次返回的结果保持不变，可以在其它线程中继续读取
+
+        Return
+        ------
+        blended: ndarray
+            融合结果，在下下次调用时被原地修改
+        """
+        params = (alpha, beta, gamma)
+        if self._blendSource is not image or self._blendParams != params:
+            self._buffers = [None, None]
+            self._blendSource = image
+            self._blendParams = params
+        back = 1 - self._front
+        blended = self._buffers[back]
+        if blended is None:
+            blended = image_blend(np.array(image), self.mask.unpack(), alpha, beta, gamma)
+            self.blendChanged = None
+        else:
+            blendThreshold = self._bufferThresholds[back]
+            index = self._between(blendThreshold, self.threshold)
+            if len(index):
+                pixels = np.asarray(image).reshape(len(self.order), -1)[index]
+                zeros = np.zeros_like(pixels)
+                if self.threshold > blendThreshold:
+                    pixels = cv2.addWeighted(pixels, alpha, zeros, beta, gamma)
+                else:
+                    pixels = cv2.addWeighted(zeros, alpha, pixels, beta, gamma)
+                blended.reshape(len(self.order), -1)[index] = pixels
+            self.blendChanged = index
+        self._buffers[back] = blended
+        self._bufferThresholds[back] = self.threshold
+        self._front = back
+        return blended
+
+# 地形分析可以输出的图层
+TERRAIN_LAYERS = ('slope', 'aspect', 'mean_curvature', 'plan_curvature', 'profile_curvature', 'hillshade')
+# 常用的地形图层组合
+DEFAULT_TERRAIN_LAYERS = ('slope', 'aspect', 'plan_curvature', 'profile_curvature')
+_CURVATURE_LAYERS = ('mean_curvature', 'plan_curvature', 'profile_curvature')
+
+def terrain_derivatives(image, grad_we, grad_sn, second=True):
+    """
+    使用3x3窗口计算dem的一阶与二阶偏导，x轴向东，y轴向北
+
+    一阶偏导与cal_slope相同(三阶不带权差分)，二阶偏导使用Evans-Young方法，边缘使用复制边界
+
+    Parameters
+    ----------
+    image: ndarray
+        dem
+    grad_we, grad_sn: float
+        dem格网宽度和高度（单位：米）
+    second: bool
+        是否计算二阶偏导
+
+    Return
+    ------
+    derivatives: tuple
+        float32的 (p, q) 或 (p, q, r, s, t)，
+        p=dz/dx, q=dz/dy, r=d2z/dx2, s=d2z/dxdy, t=d2z/dy2
+    """
+    img = np.asarray(image, dtype=np.float32)
+    kernals = [np.array([[-1, 0, 1],
+                         [-2, 0, 2],
+                         [-1, 0, 1]], dtype=np.float32) / (8 * grad_we),
+               np.array([[1, 2, 1],
+                         [0, 0, 0],
+                         [-1,-2,-1]], dtype=np.float32) / (8 * grad_sn)]
+    if second:
+        kernals += [np.array([[1, -2, 1],
+                              [1, -2, 1],
+                              [1, -2, 1]], dtype=np.float32) / (3 * grad_we * grad_we),
+                    np.array([[-1, 0, 1],
+                              [0, 0, 0],
+                              [1, 0, -1]], dtype=np.float32) / (4 * grad_we * grad_sn),
+                    np.array([[1, 1, 1],
+                              [-2,-2,-2],
+                              [1, 1, 1]], dtype=np.float32) / (3 * grad_sn * grad_sn)]
+    return tuple(cv2.filter2D(img, cv2.CV_32F, k, borderType=cv2.BORDER_REPLICATE) for k in kernals)
+
+def _terrain_layers(image, grad_we, grad_sn, layers, azimuth, altitude):
+    """
+    对一块dem计算一次偏导，并由偏导得到所需的图层
+    """
+    derivatives = terrain_derivatives(image, grad_we, grad_sn,
+                                      second=any(l in _CURVATURE_LAYERS for l in layers))
+    p, q = derivatives[:2]
+    pp, qq = p * p, q * q
+    # p^2 + q^2
+    gradient2 = pp + qq
+    result = {}
+    if 'slope' in layers or 'hillshade' in layers:
+        slope = np.sqrt(gradient2)
+        np.arctan(slope, out=slope)
+        result['slope'] = slope
+    if 'aspect' in layers or 'hillshade' in layers:
+        # 坡向为下坡方向的方位角，正北为0，顺时针增加
+        aspect = np.arctan2(-p, -q)
+        aspect[aspect < 0] += np.float32(2 * np.pi)
+        result['aspect'] = aspect
+    if 'hillshade' in layers:
+        zenith = np.radians(90 - altitude)
+        hillshade = np.cos(result['aspect'] - np.float32(np.radians(azimuth)))
+        hillshade *= np.sin(result['slope'])
+        hillshade *= np.float32(np.sin(zenith))
+        hillshade += np.float32(np.cos(zenith)) * np.cos(result['slope'])
+        np.clip(hillshade, 0, 1, out=hillshade)
+        hillshade *= 255
+        result['hillshade'] = hillshade
+    if len(derivatives) == 5:
+        r, s, t = derivatives[2:]
+        pqs = 2 * p * q * s
+        # 1 + p^2 + q^2
+        w = gradient2 + 1
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if 'mean_curvature' in layers:
+                result['mean_curvature'] = -((1 + qq) * r - pqs + (1 + pp) * t) / (2 * w * np.sqrt(w))
+            if 'plan_curvature' in layers:
+                result['plan_curvature'] = -(qq * r - pqs + pp * t) / (gradient2 * np.sqrt(w))
+            if 'profile_curvature' in layers:
+                result['profile_curvature'] = -(pp * r + pqs + qq * t) / (gradient2 * w * np.sqrt(w))
+        # 平地的平面曲率和剖面曲率没有定义，置为0
+        for layer in ('plan_curvature', 'profile_curvature'):
+            if layer in result:
+                result[layer][gradient2 == 0] = 0
+    if 'slope' in result:
+        result['slope'] *= 57.29578
+    if 'aspect' in result:
+        result['aspect'] *= 57.29578
+        # 平地没有坡向
+        result['aspect'][gradient2 == 0] = -1
+    return {layer: result[layer] for layer in layers}
+
+def terrain_analysis(image, grad_we, grad_sn, layers=DEFAULT_TERRAIN_LAYERS, out=None, blockRows=1024,
+                     azimuth=315, altitude=45, progress=None):
+    """
+    地形分析，一次计算dem的一阶和二阶偏导，并由此得到所需的图层
+
+    按行分块计算，每块上下各多读取一行，峰值内存只与分块大小有关，适用于内存映射的大幅dem
+
+    Parameters
+    ----------
+    image: ndarray or np.memmap
+        dem
+    grad_we, grad_sn: float
+        dem格网宽度和高度（单位：米）
+    layers: sequence of str
+        需要的图层，取值见TERRAIN_LAYERS
+        slope: 坡度（度）
+        aspect: 坡向（度），下坡方向的方位角，正北为0顺时针增加，平地为-1
+        mean_curvature: 平均曲率
+        plan_curvature: 平面曲率
+        profile_curvature: 剖面曲率
+        hillshade: 山体阴影，0~255
+    out: dict, optional
+        图层名到float32输出数组的映射，缺少的图层新建
+    blockRows: int
+        每块的行数
+    azimuth, altitude: float
+        山体阴影的光源方位角和高度角（度）
+    progress: callable, optional
+        progress(已完成的行数, 总行数)，每块调用一次，可以抛出异常中止计算
+
+    Return
+    ------
+    out: dict
+        图层名到float32数组的映射
+    """
+    layers = tuple(layers)
+    for layer in layers:
+        if layer not in TERRAIN_LAYERS:
+            raise ValueError('未知的地形图层：{}'.format(layer))
+    out = dict(out or {})
+    for layer in layers:
+        if layer not in out:
+            out[layer] = np.empty(image.shape, dtype=np.float32)
+    height = image.shape[0]
+    for r0 in range(0, height, blockRows):
+        r1 = min(r0 + blockRows, height)
+        h0, h1 = max(r0 - 1, 0), min(r1 + 1, height)
+        result = _terrain_layers(image[h0:h1], grad_we, grad_sn, layers, azimuth, altitude)
+        for layer in layers:
+            out[layer][r0:r1] = result[layer][r0 - h0:r1 - h0]
+        if progress is not None:
+            progress(r1, height)
+    return {layer: out[layer] for layer in layers}
+
+def cal_curvature(image, method='conv'):
+    """
+    计算一张图像的曲率
+
+    Parameters
+    ----------
+    img_array : ndarray
+    method : {'conv', 'derivation', 'dawei}, optional
+        conv使用一次卷积操作，求得平均曲率
+        derivation使用二阶偏导，求得平均曲率
+        dawei使用二阶偏导，求得平面曲率curv_kh和剖面曲率curv_kv
+        derivation与dawei使用terrain_analysis计算，偏导只计算一次
+
+    Returns
+    -------
+    'conv'与'derivation'返回平均曲率，类型ndarray
+    'dawei'返回平面曲率curv_kh和剖面曲率curv_kv，类型tuple
+
+    """
+    if method == 'conv':
+        kernal = np.array([[-1/16, 5/16, -1/16],
+                            [5/16, -1, 5/16],
+                            [-1/16, 5/16, -1/16]])
+        final = cv2.filter2D(image, -1, kernal) 
+    elif method == 'derivation':
+        final = terrain_analysis(image, 1, 1, ('mean_curvature',))['mean_curvature']
+        final=abs(final)
+        final = (final-final.min())/(final.max()-final.min())
+        final = final * 255
+        final = final.astype(np.uint8)
+    elif method == 'dawei':
+        result = terrain_analysis(image, 1, 1, ('plan_curvature', 'profile_curvature'))
+        final = (result['plan_curvature'], result['profile_curvature'])
+    return final
+
+def stretch_uint8(image, out=None, blockRows=1024):
+    """
+    将高程等浮点数据线性拉伸到0~255，只用于显示，计算仍使用原始数据
+
+    按行分块计算，先求全图的最值再逐块写出，适用于内存映射的大幅dem，nan输出为0
+
+    Parameters
+    ----------
+    image: ndarray or np.memmap
+    out: ndarray or np.memmap, optional
+        uint8输出数组，为None时新建
+    blockRows: int
+        每块的行数
+
+    Return
+    ------
+    out: ndarray
+        uint8预览图
+    """
+    height = image.shape[0]
+    if out is None:
+        out = np.empty(image.shape, dtype=np.uint8)
+    _min, _max = np.inf, -np.inf
+    for r0 in range(0, height, blockRows):
+        block = np.asarray(image[r0:r0 + blockRows], dtype=np.float32)
+        if np.isnan(block).all():
+            continue
+        _min = min(_min, float(np.nanmin(block)))
+        _max = max(_max, float(np.nanmax(block)))
+    scale = 255 / (_max - _min) if _max > _min else 0
+    for r0 in range(0, height, blockRows):
+        block = np.array(image[r0:r0 + blockRows], dtype=np.float32)
+        block -= _min
+        block *= scale
+        np.nan_to_num(block, copy=False)
+        out[r0:r0 + blockRows] = np.clip(block, 0, 255, out=block)
+    return out
+
+def tif2bmp(image):
+    """
+    将tif转为灰度位图，只用于显示
+    """
+    return Image.fromarray(stretch_uint8(image))
@@ -0,0 +1,204 @@
+"""
+村落骨架批量提取，不依赖Qt界面
+
+使用方法：
+    python batch.py 图像目录 输出目录 [--outline-dir 边界线目录] [--methods medaxis skeletonize lee] [--workers 8]
+
+边界线目录中与原图同名(不含后缀)的图像作为该村落的边界线图像，
+未指定边界线目录时，直接从原图中提取边界线
+"""
+import argparse
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+from pipeline import *
+from parallel import *
+from cache import SkeletonCache, DEFAULT_CACHE_DIR
+from graph import SkeletonGraph
+from raster import open_image, read_image
+
+
+IMAGE_SUFFIXES = ('.jpg', '.tif', '.tiff', '.png', '.jpeg')
+
+def find_pairs(imageDir, outlineDir=None):
+    """
+    查找原图与边界线图像对
+
+    Parameters
+    ----------
+    imageDir: str
+        原图目录
+    outlineDir: str, optional
+        边界线图像目录，为None时边界线图像即为原图
+
+    Return
+    ------
+    pairs: list
+        [(原图路径, 边界线图像路径), ...]
+    """
+    images = sorted(p for p in Path(imageDir).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    if outlineDir is None:
+        return [(p, p) for p in images]
+    outlines = {p.stem: p for p in Path(outlineDir).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES}
+    pairs = []
+    for p in images:
+        if p.stem in outlines:
+            pairs.append((p, outlines[p.stem]))
+        else:
+            print('未找到{}的边界线图像，已跳过'.format(p.name))
+    return pairs
+
+def mask_job(imagePath, outlinePath, outlineColors, imageSpec, maskSpec):
+    """
+    进程池任务：解码原图与边界线图像，将原图和各类区域的标记图写入共享内存
+
+    Return
+    ------
+    found: list
+        找到区域的颜色
+    """
+    imageShm, image = attach_array(imageSpec)
+    maskShm, mask = attach_array(maskSpec)
+    try:
+        read_image(imagePath, image, 'RGB')
+        outline = open_image(outlinePath).convert('RGB')
+        if outline.size != (image.shape[1], image.shape[0]):
+            outline = outline.resize((image.shape[1], image.shape[0]), Image.NEAREST)
+        labels, _ = extract_region_labels(np.array(outline, dtype=np.uint8), outlineColors)
+        mask[...] = labels
+        # 去噪后为空的区域视为未找到
+        return [color for color in outlineColors if (labels == color.value).any()]
+    finally:
+        del image, mask
+        imageShm.close()
+        maskShm.close()
+
+def skeleton_job(imageSpec, maskSpec, outlineColor, method, resultPath, axisColor, axisWidth, cacheDir,
+                 exportGraph=False):
+    """
+    进程池任务：从共享内存读取标记图中outlineColor一类的区域，提取骨架并保存融合结果，
+    exportGraph为True时同时将骨架图导出为同名的GeoJSON文件
+
+    Return
+    ------
+    resultPath: Path
+    """
+    imageShm, image = attach_array(imageSpec)
+    maskShm, mask = attach_array(maskSpec)
+    try:
+        regionMask = (mask == outlineColor.value).astype(np.uint8)
+        # 已经在进程池中，各连通区域在本进程内依次计算
+        if cacheDir is None:
+            skeleton = extract_skeleton_by_component(regionMask, method, workers=1)
+        else:
+            skeleton = SkeletonCache(cacheDir).skeleton(regionMask, method, workers=1)
+        graph = SkeletonGraph.from_skeleton(skeleton, regionMask)
+        del skeleton
+        result = render_result(image, regionMask, graph, axisColor, axisWidth)
+        Image.fromarray(result).save(resultPath)
+        if exportGraph:
+            graph.save_geojson(Path(resultPath).with_suffix('.geojson'))
+        return resultPath
+    finally:
+        del image, mask
+        imageShm.close()
+        maskShm.close()
+
+def result_name(stem, outlineColor, suffix, outlineColors):
+    """
+    结果文件名，只提取一种颜色时不在文件名中标注颜色
+    """
+    if len(outlineColors) == 1:
+        return '{}_{}.png'.format(stem, suffix)
+    return '{}_{}_{}.png'.format(stem, outlineColor.name, suffix)
+
+def process_villages(pairs, outputDir, methods, outlineColors, axisColor, axisWidth, workers=None,
+                     cacheDir=DEFAULT_CACHE_DIR, exportGraph=False):
+    """
+    并行处理多个村落，每个村落的 掩膜提取 与 各颜色区域的各骨架提取方法 分别作为独立任务分配到进程池
+
+    同一时间最多有workers个村落的原图和掩膜驻留在共享内存中，cacheDir为None时不使用骨架缓存
+
+    Return
+    ------
+    results: list
+        与pairs顺序一致，每个元素为该村落保存的结果文件路径列表，未找到轮廓线时为空列表
+    """
+    workers = workers or default_workers()
+    outputDir = Path(outputDir)
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for i in range(0, len(pairs), workers):
+            chunk = pairs[i:i + workers]
+            shms, specs = [], []
+            try:
+                for imagePath, _ in chunk:
+                    # 只读取图像头获取尺寸，不解码
+                    width, height = open_image(imagePath).size
+                    imageShm, imageSpec = share_array((height, width, 3), np.uint8)
+                    shms.append(imageShm)
+                    maskShm, maskSpec = share_array((height, width), np.uint8)
+                    shms.append(maskShm)
+                    specs.append((imageSpec, maskSpec))
+                found = run_parallel(mask_job, [(imagePath, outlinePath, outlineColors, imageSpec, maskSpec)
+                                                for (imagePath, outlinePath), (imageSpec, maskSpec) in zip(chunk, specs)],
+                                     executor=pool)
+                jobs = []
+                for (imagePath, _), (imageSpec, maskSpec), colors in zip(chunk, specs, found):
+                    stem = Path(imagePath).stem
+                    for color in colors:
+                        for method in methods:
+                            jobs.append((imageSpec, maskSpec, color, method,
+                                         outputDir / result_name(stem, color, method, outlineColors),
+                                         axisColor, axisWidth, cacheDir, exportGraph))
+                saved = iter(run_parallel(skeleton_job, jobs, executor=pool))
+                for (imagePath, _), (_, maskSpec), colors in zip(chunk, specs, found):
+                    stem = Path(imagePath).stem
+                    maskShm, mask = attach_array(maskSpec)
+                    paths = []
+                    for color in colors:
+                        maskPath = outputDir / result_name(stem, color, 'mask', outlineColors)
+                        Image.fromarray(((mask == color.value) * 255).astype(np.uint8)).save(maskPath)
+                        paths.append(maskPath)
+                        paths.extend(next(saved) for _ in methods)
+                    del mask
+                    maskShm.close()
+                    results.append(paths)
+            finally:
+                for shm in shms:
+                    release_array(shm)
+    return results
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='村落骨架批量提取')
+    parser.add_argument('image_dir', help='原图目录')
+    parser.add_argument('output_dir', help='输出目录')
+    parser.add_argument('--outline-dir', default=None, help='边界线图像目录，默认从原图中提取边界线')
+    parser.add_argument('--methods', nargs='+', default=list(SKELETON_METHODS), choices=SKELETON_METHODS,
+                        help='骨架提取方法')
+    parser.add_argument('--outline-color', nargs='+', default=['red'], choices=[c.name for c in OutlineColor],
+                        help='边界线颜色，可以指定多种颜色，分别提取各类区域(如村落、山体、水体)的骨架')
+    parser.add_argument('--axis-color', default='橙色', choices=list(colorDict), help='轴线颜色')
+    parser.add_argument('--axis-width', type=int, default=7, help='轴线宽度')
+    parser.add_argument('--workers', type=int, default=None, help='并行进程数，默认为cpu核数')
+    parser.add_argument('--no-cache', action='store_true', help='不使用骨架结果缓存')
+    parser.add_argument('--export-graph', action='store_true', help='将骨架图(节点与折线)导出为GeoJSON')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    pairs = find_pairs(args.image_dir, args.outline_dir)
+    results = process_villages(pairs, args.output_dir, args.methods, [OutlineColor[c] for c in args.outline_color],
+                               colorDict[args.axis_color], args.axis_width, args.workers,
+                               None if args.no_cache else DEFAULT_CACHE_DIR, args.export_graph)
+    for (imagePath, _), saved in zip(pairs, results):
+        if saved:
+            print('{}: 已保存{}个结果'.format(imagePath.name, len(saved)))
+        else:
+            print('{}: 未找到轮廓线'.format(imagePath.name))
+
+if __name__ == '__main__':
+    main()
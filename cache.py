@@ -0,0 +1,149 @@
+"""
+骨架结果缓存，以 村落掩膜内容的哈希值 + 骨架提取方法 + 参数 作为键保存在磁盘上，
+超出容量时按最近使用时间淘汰
+"""
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+from pipeline import extract_skeleton_by_component
+from masks import PackedMask
+
+
+# 默认缓存目录与容量
+DEFAULT_CACHE_DIR = Path.home() / '.village_skeleton' / 'skeleton_cache'
+DEFAULT_MAX_BYTES = 1 << 30
+# 缓存格式版本，参与缓存键的计算，格式改变后旧的结果不再被读取并最终被淘汰
+# 2: 中轴变换的距离值以float64保存，与extract_skeleton的结果一致
+CACHE_VERSION = 2
+
+def evict_lru(directory, pattern, limit, keep=()):
+    """
+    按最近使用时间(修改时间)淘汰directory中匹配pattern的文件，直到总大小不超过limit，
+    骨架缓存和栅格缓存共用
+
+    Parameters
+    ----------
+    pattern: str
+        文件名通配符，如'*.npz'，名称中带'.tmp.'的临时文件不参与淘汰
+    limit: int
+        总大小上限(字节)
+    keep: iterable of Path
+        不淘汰的文件，如刚写入的文件
+    """
+    keep = {Path(p) for p in keep}
+    entries = []
+    for p in Path(directory).glob(pattern):
+        # 跳过其它进程正在写入的临时文件
+        if '.tmp.' in p.name:
+            continue
+        try:
+            stat = p.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, p))
+    total = sum(size for _, size, _ in entries)
+    for _, size, p in sorted(entries):
+        if total <= limit:
+            break
+        if p in keep:
+            continue
+        try:
+            # 已经以内存映射方式打开的文件在删除后仍然可以读取(Windows下删除失败时跳过)
+            p.unlink()
+        except OSError:
+            continue
+        total -= size
+
+def clear_cache(directory, pattern):
+    """
+    删除directory中匹配pattern的所有缓存文件
+    """
+    directory = Path(directory)
+    if directory.exists():
+        for p in directory.glob(pattern):
+            try:
+                p.unlink()
+            except OSError:
+                continue
+
+class SkeletonCache(object):
+    """
+    骨架结果缓存，只保存骨架像素的坐标和中轴变换的距离值，大小与骨架长度相关，与图像大小无关
+    """
+    def __init__(self, cacheDir=None, maxBytes=DEFAULT_MAX_BYTES) -> None:
+        self.cacheDir = Path(cacheDir) if cacheDir is not None else DEFAULT_CACHE_DIR
+        self.maxBytes = maxBytes
+
+    def key(self, villageMask, method, **params):
+        """
+        计算缓存键，掩膜按位压缩后参与哈希，已压缩的掩膜(PackedMask)直接参与哈希
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(PackedMask.from_array(villageMask).packed.tobytes())
+        digest.update(repr((CACHE_VERSION, villageMask.shape, method, sorted(params.items()))).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, villageMask, method, **params):
+        """
+        读取缓存的骨架
+
+        Return
+        ------
+        skeleton: ndarray
+            与extract_skeleton结果相同类型的骨架图，未命中时为None
+        """
+        path = self.cacheDir / '{}.npz'.format(self.key(villageMask, method, **params))
+        try:
+            with np.load(path) as data:
+                ys, xs, values = data['ys'], data['xs'], data['values']
+        except (OSError, KeyError, ValueError):
+            return None
+        # 更新访问时间，用于淘汰最久未使用的结果
+        os.utime(path)
+        if method == 'medaxis':
+            skeleton = np.zeros(villageMask.shape, dtype=np.float64)
+        else:
+            skeleton = np.zeros(villageMask.shape, dtype=bool)
+        skeleton[ys, xs] = values
+        return skeleton
+
+    def put(self, villageMask, method, skeleton, **params):
+        """
+        保存骨架，并在超出容量时淘汰最久未使用的结果
+        """
+        self.cacheDir.mkdir(parents=True, exist_ok=True)
+        ys, xs = np.nonzero(skeleton)
+        # 中轴变换的距离值保持float64，命中与未命中时返回的骨架完全相同
+        values = skeleton[ys, xs]
+        path = self.cacheDir / '{}.npz'.format(self.key(villageMask, method, **params))
+        # 先写临时文件再重命名，避免其它进程读到不完整的文件
+        tmpPath = path.with_name('{}.{}.tmp.npz'.format(path.stem, os.getpid()))
+        np.savez_compressed(tmpPath, ys=ys.astype(np.int32), xs=xs.astype(np.int32), values=values)
+        os.replace(tmpPath, path)
+        self.evict(keep=[path])
+
+    def skeleton(self, villageMask, method, workers=1, progress=None):
+        """
+        读取缓存的骨架，未命中时按连通区域提取骨架并写入缓存
+        """
+        skeleton = self.get(villageMask, method)
+        if skeleton is None:
+            if isinstance(villageMask, PackedMask):
+                villageMask = villageMask.unpack()
+            skeleton = extract_skeleton_by_component(villageMask, method, workers, progress)
+            self.put(villageMask, method, skeleton)
+        return skeleton
+
+    def evict(self, keep=()):
+        """
+        按最近使用时间淘汰缓存，直到总大小不超过maxBytes
+        """
+        evict_lru(self.cacheDir, '*.npz', self.maxBytes, keep)
+
+    def clear(self):
+        """
+        清空缓存
+        """
+        clear_cache(self.cacheDir, '*.npz')
@@ -1,45 +1,103 @@
+import math
 import time
 import numpy as np
-from PyQt5.QtWidgets import QWidget
-from PyQt5.QtCore import pyqtSignal
+from PyQt5.QtWidgets import QWidget, QProgressBar, QPushButton, QShortcut
+from PyQt5.QtCore import pyqtSignal, QThreadPool
+from PyQt5.QtGui import QKeySequence
 from axisTrans import Ui_MainWindow as axisTransWindow
-from skimage.morphology import medial_axis, skeletonize
 from parameters import Ui_Form as paraWindow
 from func import *
+from pipeline import SKELETON_METHODS, extract_village_mask, denoise_mask, composite_frames
+from dag import PipelineGraph, node_property
+from masks import PackedMask, combine_masks, resize_mask
+from raster import RasterStore
+from cache import SkeletonCache
+from graph import SkeletonGraph
+from offset import OffsetCalculator
+from pyramid import PyramidCache
+from viewer import ImageView
+from worker import Task, report_progress
+from overlay import StrokeLayer
 
 
 class AxisTrans(BaseMainWindow, axisTransWindow):
     """
     村落骨架提取，包括中轴变换与图像细化技术
+
+    流水线中的数据、参数和结果都保存在依赖图self.pipeline中，数据或参数改变时只重新计算受影响的结果
     """
+    # 流水线的源节点
+    originalImg = node_property('originalImg', '原始图像')
+    outlineImg = node_property('outlineImg', '带有村落边界线的图像，用于确定村落区域')
+    villageOutline = node_property('villageOutline', '通过村落边界或山水轮廓线获得的村落区域，按位压缩保存')
+    waterMask = node_property('waterMask', '水体掩膜，从村落区域中去除')
+    elevationData = node_property('elevationData', '村落高程数据，用于辅助中轴线生成')
+    skeletonMethod = node_property('skeletonMethod', '当前显示的骨架提取方法')
+    gradWe = node_property('gradWe', 'dem格网宽度')
+    gradSn = node_property('gradSn', 'dem格网高度')
+    slope_threshold = node_property('slope_threshold', '坡度阈值')
+    useSlopeMask = node_property('useSlopeMask', '村落掩膜是否与坡度适宜区求交，划分坡度区域后为True，默认为None(不求交)')
+    kernelSize = node_property('kernelSize', '核大小')
+    iterNum = node_property('iterNum', '迭代次数')
+    axisColor = node_property('axisColor', '轴线颜色')
+    axisWidth = node_property('axisWidth', '轴线宽度')
+    outlineColor = node_property('outlineColor', '边界线颜色')
+    # 流水线的计算节点
+    # 掩膜节点都按位压缩保存(PackedMask)，在OpenCV/skimage调用处解压
+    outlineMask = node_property('outlineMask', '由边界线图像提取的村落掩膜')
+    villageMask = node_property('villageMask', '村落掩膜，村落区域去除水体(划分坡度区域后再与坡度适宜区求交)的结果')
+    slopeImg = node_property('slopeImg', '坡度图')
+    curvatureImg = node_property('curvatureImg', '曲率图')
+    slopeDivided = node_property('slopeDivided', '坡度小于坡度阈值的区域')
+
     def __init__(self, parent=None) -> None:
         super(AxisTrans, self).__init__(parent=parent)
         self.setupUi(self)
+        # 分块显示的图像查看器替代label，支持缩放和平移，鼠标点击以原始分辨率的图像坐标发出
+        self.view = ImageView(self.centralwidget, pyramids=PyramidCache())
+        self.horizontalLayout.replaceWidget(self.label, self.view)
+        self.label.hide()
+        self.view.imagePressed.connect(self.image_pressed)
         self.eventType = EventType.noneType     # 事件类型，用于控制鼠标事件
         # 初始化
-        self.originalImg = None     # 原始图像
-        self.villageMask = None     # 村落掩膜，通过村落边界或山水轮廓线获得的村落区域
-        self.pixmap = None          # 显示在qlabel中的pixmap图
-        self.slopeImg = None        # 坡度图
-        self.curvatureImg = None    # 曲率图
-        self.slopeDivided = None    # 坡度小于坡度阈值的区域
-        self.elevationData = None   # 村落高程数据，用于辅助中轴线生成
-        self.outlineImg = None      # 带有村落边界线的图像，用于确定村落区域
+        self.rasterStore = RasterStore()    # 栅格缓存，图像只解码一次，之后以内存映射方式读取
+        self.skeletonCache = SkeletonCache()    # 骨架结果缓存，重新打开同一村落时无需重新计算
+        self.pipeline = self.build_pipeline()   # 流水线依赖图
         self.resultImg = None       # 结果图像，融合骨架线和原始图像后的结果
-        self.outlinePix = None      # 绘制村落边界线的中间过程图像
-        self.skPix = None           # 骨架线的中间过程图像
         self.img_name = None        # 图片名
-        self.showing_pixmap = None     # 正在label中显示的图片
+        # 耗时的计算在后台线程中执行，同一时间只执行一个任务，新任务开始时取消旧任务
+        self.threadPool = QThreadPool(self)
+        self.threadPool.setMaxThreadCount(1)
+        self.task = None            # 正在执行的后台任务
+        self.progressBar = QProgressBar()
+        self.progressBar.setMaximumWidth(200)
+        self.cancelButton = QPushButton('取消')
+        self.cancelButton.clicked.connect(self.cancel_task)
+        self.statusbar.addPermanentWidget(self.progressBar)
+        self.statusbar.addPermanentWidget(self.cancelButton)
+        self.progressBar.hide()
+        self.cancelButton.hide()
         # 默认参数
         self.gradWe = 0.53     # dem格网宽度，0.53米/像素
         self.gradSn = 0.53     # dem格网高度，0.53米/像素
         self.slope_threshold = 15       # 坡度阈值
         self.kernelSize = 15     # 核大小 
         self.iterNum = 10       # 迭代次数
+        self.offsetTolerance = 5.0      # 偏移度计算中道路距骨架线的距离阈值（单位：米）
         self.sleepTime = 0.0001      # 控制动态显示的间隔时间
         # 画笔颜色
         self.contourPenCol = QColor('#FF0000')      # 轮廓线，默认为红色
         self.roadPenCol = QColor('#33FFFF')         # 道路线，默认为蓝色
+        # 手绘的边界线和道路线以矢量线条显示在图像上方，不重绘底图
+        self.outlineLayer = StrokeLayer(self.view, self.outline_pen())
+        self.roadLayer = StrokeLayer(self.view, self.road_pen())
+        # 界面中未使用的“打开掩码”菜单项用于加载水体掩膜
+        self.action_openmask.setText('打开水体掩膜')
+        self.action_openmask.triggered.connect(self.openWater)
+        self.menu.insertAction(self.action_addDem, self.action_openmask)
+        QShortcut(QKeySequence.Undo, self, self.undoLine)
+        QShortcut(QKeySequence.Redo, self, self.redoLine)
+        QShortcut(QKeySequence.Delete, self, self.deleteLine)
         # 轴线三通道值
         self.axisColor = colorDict['橙色']       # 轴线颜色，默认为橙色
         self.axisWidth = 7                          # 轴线宽度
@@ -49,6 +107,97 @@ class AxisTrans(BaseMainWindow, axisTransWindow):
                 self.slope_threshold, self.sleepTime, self.contourPenCol, self.roadPenCol, self.axisColor, self.axisWidth, self.outlineColor)
         self.paraWindow.para_commit.connect(self.update_parameters)
 
+    def build_pipeline(self):
+        """
+        建立流水线依赖图
+        边界线图像 -> 村落掩膜 -> 骨架图(提取骨架后只保留图) -> 结果图像 / 偏移度计算
+        dem -> 坡度 -> 坡度掩膜
+        """
+        pipeline = PipelineGraph()
+        for name in ('originalImg', 'outlineImg', 'villageOutline', 'waterMask', 'elevationData', 'skeletonMethod',
+                     'gradWe', 'gradSn', 'slope_threshold', 'useSlopeMask', 'kernelSize', 'iterNum',
+                     'axisColor', 'axisWidth', 'outlineColor'):
+            pipeline.source(name)
+        # 坡度和曲率由地形分析按行分块计算，只需要坡度时不计算二阶偏导
+        pipeline.stage('slopeImg', lambda dem, we, sn: terrain_analysis(dem, we, sn, ('slope',),
+                                                                        progress=report_progress)['slope'],
+                       ('elevationData', 'gradWe', 'gradSn'))
+        pipeline.stage('curvatureImg', lambda dem, we, sn: terrain_analysis(dem, we, sn, ('mean_curvature',),
+                                                                            progress=report_progress)['mean_curvature'],
+                       ('elevationData', 'gradWe', 'gradSn'))
+        # 坡度图只排序一次，坡度阈值改变时只翻转新旧阈值之间的像素，融合图像也只重绘这些像素
+        pipeline.stage('slopeThreshold', ThresholdMask, ('slopeImg',))
+        pipeline.stage('slopeDivided', ThresholdMask.select, ('slopeThreshold', 'slope_threshold'))
+        pipeline.stage('slopeOverlay', lambda index, mask, image: index.blend(image, 1, 0.4, 0),
+                       ('slopeThreshold', 'slopeDivided', 'originalImg'))
+        pipeline.stage('outlineMask', self.outline_mask, ('outlineImg', 'outlineColor'))
+        # useSlopeMask为None时slopeMask直接为None，不计算坡度，dem和坡度参数改变时也不清空村落掩膜
+        pipeline.stage('slopeMask', lambda use, mask: mask, ('useSlopeMask', 'slopeDivided'), gate='useSlopeMask')
+        pipeline.stage('villageMask', self.combine_village_mask, ('villageOutline', 'slopeMask', 'waterMask'),
+                       optional=('slopeMask', 'waterMask'))
+        for method in SKELETON_METHODS:
+            pipeline.stage('graph:' + method, lambda mask, method=method: self.skeleton_graph(mask, method),
+                           ('villageMask',))
+            pipeline.stage('result:' + method, self.render_skeleton,
+                           ('graph:' + method, 'originalImg', 'villageMask', 'iterNum', 'kernelSize', 'axisWidth', 'axisColor'))
+            pipeline.stage('offset:' + method, OffsetCalculator, ('graph:' + method, 'gradWe', 'gradSn', 'villageMask'))
+        return pipeline
+
+    def outline_mask(self, outlineImg, outlineColor):
+        """
+        根据边界线颜色提取边界线并填充，得到压缩的村落掩膜，未找到边界线时为None
+        """
+        mask = extract_village_mask(np.asarray(outlineImg, np.uint8), outlineColor)[0]
+        return None if mask is None else PackedMask.from_array(mask)
+
+    def skeleton_graph(self, villageMask, method):
+        """
+        提取骨架并构建骨架图，整幅的骨架栅格只在构建期间存在，不保存在流水线中
+        """
+        skeleton = self.skeletonCache.skeleton(villageMask, method, workers=None, progress=report_progress)
+        return SkeletonGraph.from_skeleton(skeleton, villageMask)
+
+    def combine_village_mask(self, villageOutline, slopeMask, waterMask):
+        """
+        村落区域去除水体，启用坡度掩膜时再与坡度小于阈值的区域求交，得到骨架提取使用的村落掩膜
+        """
+        include = [] if slopeMask is None else [resize_mask(slopeMask, villageOutline.shape)]
+        exclude = [] if waterMask is None else [resize_mask(waterMask, villageOutline.shape)]
+        if not include and not exclude:
+            return villageOutline
+        # 与边界线提取相同，开运算去除求交后留下的碎小区域
+        return PackedMask.from_array(denoise_mask(combine_masks(villageOutline, include, exclude)))
+
+    @property
+    def eventType(self):
+        """
+        事件类型，绘制和取色时鼠标拖动不再平移图像
+        """
+        return self._eventType
+
+    @eventType.setter
+    def eventType(self, value):
+        self._eventType = value
+        self.view.set_drawing(value in (EventType.drawOutline, EventType.drawRoad, EventType.extractColor))
+
+    @property
+    def skeletonGraph(self):
+        """
+        当前骨架提取方法的骨架图，节点为端点/交叉点，边为骨架像素链
+        """
+        if self.skeletonMethod is None:
+            return None
+        return self.pipeline.get('graph:' + self.skeletonMethod)
+
+    @property
+    def offsetCalculator(self):
+        """
+        当前骨架图的道路偏移度计算，骨架图或格网大小改变后重新建立
+        """
+        if self.skeletonMethod is None:
+            return None
+        return self.pipeline.get('offset:' + self.skeletonMethod)
+
     def open_file(self):
         """
         读取遥感图像
@@ -58,18 +207,15 @@ class AxisTrans(BaseMainWindow, axisTransWindow):
             fname ,_ = QFileDialog.getOpenFileName(self,'Open File','function/axis_trans/data/黔东南6个村子宜居区域15度',
                                                     'Image files (*.jpg *.tif *.tiff *.png *.jpeg)')
             if fname != '':
-                image = Image.open(fname)
+                image = self.rasterStore.open(fname, 'RGB')
                 self.img_name = Path(fname).stem
-                # 将图片按照原始比例显示在label
-                self.label_show(image)
-                self.label.setMinimumSize(1, 1)
-                self.label.installEventFilter(self)
+                self.show_image(image)
+                self.reset_village()
                 self.originalImg = image
                 # temp code start
                 self.eventType = EventType.loadOutline
                 self.outlineImg = image
                 # temp code end
-                self.empty_result()
         except Exception as e:
             QMessageBox.warning(self, '提示', '打开图片失败，请检查图片类型和图片大小！', QMessageBox.Ok)
             print(e)
@@ -83,17 +229,51 @@ class AxisTrans(BaseMainWindow, axisTransWindow):
             if self.originalImg is None:
                 QMessageBox.warning(self, '提示', '请先添加原图！', QMessageBox.Ok)
             else:
-                self.originalImg = self.originalImg.resize((self.label.width(), self.label.height()))
                 fname ,_ = QFileDialog.getOpenFileName(self,'Open File','function/axis_trans/data',
                                                         'Image files (*.jpg *.tif *.tiff *.png *.jpeg)')
                 if fname != '':
-                    image = Image.open(fname)
-                    self.label_show(image)
+                    image = self.rasterStore.open(fname, 'RGB')
+                    self.show_image(image)
+                    self.reset_village()
                     self.outlineImg = image
-                    self.empty_result()
         except Exception as e:
             QMessageBox.warning(self, '提示', '打开轮廓线失败，请检查图片类型和图片大小！', QMessageBox.Ok)
 
+    def reset_village(self):
+        """
+        加载新图像时清空上一幅图像的村落区域、骨架和手绘线条，避免与新图像的大小不一致
+        """
+        self.cancel_task()
+        self.villageOutline = None
+        self.waterMask = None
+        self.useSlopeMask = None
+        self.skeletonMethod = None
+        self.resultImg = None
+        self.outlineLayer.clear()
+        self.roadLayer.clear()
+
+    def openWater(self):
+        """
+        读取水体掩膜图像，非0像素为水体，提取村落时从村落区域中去除
+        """
+        self.eventType = EventType.noneType
+        try:
+            if self.originalImg is None:
+                QMessageBox.warning(self, '提示', '请先添加原图！', QMessageBox.Ok)
+                return
+            fname ,_ = QFileDialog.getOpenFileName(self,'Open water mask','function/axis_trans/data',
+                                                    'Image files (*.jpg *.tif *.tiff *.png *.jpeg)')
+            if fname != '':
+                water = self.rasterStore.open(fname, 'L')
+                self.waterMask = PackedMask.from_array(resize_mask(water, self.originalImg.shape))
+                if self.villageOutline is not None:
+                    self.show_village()
+                else:
+                    self.show_image(np.asarray(water))
+        except Exception as e:
+            QMessageBox.warning(self, '提示', '打开水体掩膜失败，请检查图片类型和图片大小！', QMessageBox.Ok)
+            print(e)
+
     def add_elevationData(self):
         """
         添加高程数据
@@ -103,11 +283,9 @@ class AxisTrans(BaseMainWindow, axisTransWindow):
             fname ,_ = QFileDialog.getOpenFileName(self,'Open elevation File','function/axis_trans/data',
                                                     'Image files (*.jpg *.tif *.tiff *.png *.jpeg)')
             if fname != '':
-                image = Image.open(fname)
-                image = tif2bmp(image)
-                self.label_show(image)
-                self.elevationData = image
-                self.empty_result()
+                # 高程数据保持float32精度并以内存映射方式读取，8位预览图只用于显示
+                self.elevationData = self.rasterStore.open(fname, dtype=np.float32)
+                self.show_image(self.rasterStore.preview(fname))
         except:
             QMessageBox.warning(self, '提示', '打开高程数据失败，请检查图片类型和图片大小！', QMessageBox.Ok)
 
@@ -119,7 +297,7 @@ class AxisTrans(BaseMainWindow, axisTransWindow):
         if self.originalImg is None:
             QMessageBox.warning(self, '提示', '显示原图失败，请重新加载！', QMessageBox.Ok)
         else:
-            self.label_show(self.originalImg)
+            self.show_image(self.originalImg)
 
     def draw_outline(self):
         """
@@ -127,12 +305,9 @@ class AxisTrans(BaseMainWindow, axisTransWindow):
         """
         # 更改鼠标事件
         self.eventType = EventType.drawOutline
-        self.contourPoints = [[]]       # 保存绘制的边界线
-        self.contourNum = 0             # 边界线条数
-        self.lastPoint = QPoint()       # 起始点
-        self.endPoint = QPoint()        # 结束点
-        # 将原始图像赋给outlinePix
-        self.outlinePix = pil2pixmap(self.originalImg)
+        self.outlineLayer.clear()
+        self.roadLayer.clear()
+        self.show_image(self.originalImg)
 
     def extract_village(self):
         """
@@ -143,23 +318,13 @@ class AxisTrans(BaseMainWindow, axisTransWindow):
             # 替换鼠标事件类型，停止鼠标事件
             self.eventType = EventType.noneType
             try:
-                # 清除轮廓线列表中的空数组
-                while [] in self.contourPoints:
-                    self.contourPoints.remove([])
-                # 村落掩膜初始化
-                imgMask = np.zeros((self.label.height(), self.label.width()), dtype=np.uint8)
-                # 将轮廓线转为ndarray类型
-                for idx, val in enumerate(self.contourPoints):
-                    self.contourPoints[idx] = np.array(val)
+                # 村落掩膜初始化，与原图大小相同
+                imgMask = np.zeros(self.originalImg.shape[:2], dtype=np.uint8)
                 # opencv 填充函数，填充轮廓线中的区域
-                cv2.fillPoly(imgMask, self.contourPoints, color=(1, 1, 1))
-                self.villageMask = imgMask
-                # 将掩膜与原图进行融合
-                image = np.array(self.originalImg, dtype=np.uint8)
-                result = image_blend(image, self.villageMask, 1, 0.6, 0)
-                result = Image.fromarray(result)
-                self.label_show(result)
-                self.empty_result()
+                cv2.fillPoly(imgMask, self.outlineLayer.polylines(), color=(1, 1, 1))
+                self.villageOutline = PackedMask.from_array(imgMask)
+                self.outlineLayer.clear()
+                self.show_village()
             except Exception as e:
                 QMessageBox.warning(self, '提示', '未知错误\n{}'.format(e), QMessageBox.Ok)
 
@@ -170,175 +335,273 @@ class AxisTrans(BaseMainWindow, axisTransWindow):
             else:
                 # 关闭鼠标事件
                 self.eventType = EventType.noneType
-                try:
-                    # 根据边界线颜色提取边界线
-
-                    image = np.array(self.outlineImg, np.uint8)
-                    outlineMask = getOutlineMask(image, self.outlineColor)
-                    # 查找轮廓
-                    contours, _ = cv2.findContours(outlineMask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
-                    if len(contours) == 0:
-                        QMessageBox.warning(self, '提示', '未找到轮廓线，请进行取色后重试！', QMessageBox.Ok)
-                    else:
-                        im_result = np.zeros_like(self.outlineImg, dtype=np.uint8)
-                        # 绘制轮廓
-                        im_result = cv2.drawContours(im_result, contours, -1, (0, 255, 0), -1)
-                        # 转为单通道图
-                        villageMask = cv2.cvtColor(im_result, cv2.COLOR_BGR2GRAY)
-                        # 设置卷积核
-                        kernel = np.ones((9, 9),np.uint8)
-                        # 闭运算消除噪点
-                        villageMask = cv2.erode(villageMask, kernel)
-                        villageMask = cv2.dilate(villageMask, kernel)
-                        # 将村落掩码resize到label大小
-                        villageMask[villageMask > 0] = 1
-                        self.villageMask = villageMask
-                        # 融合
-                        image = np.array(self.originalImg, dtype=np.uint8)
-                        result = image_blend(image, self.villageMask, 1, 0.6, 0)
-                        result = Image.fromarray(result)
-                        self.label_show(result)
-                        self.empty_result()
-                except Exception as e:
-                    QMessageBox.warning(self, '提示', '未知错误\n{}'.format(e), QMessageBox.Ok)
+                # 根据边界线颜色提取边界线，并填充得到村落掩膜
+                self.run_task('正在提取边界线', lambda task: self.outlineMask, finished=self.outline_extracted)
+
+    def outline_extracted(self, villageMask):
+        """
+        边界线提取完成，保存村落区域并显示
+        """
+        if villageMask is None:
+            QMessageBox.warning(self, '提示', '未找到轮廓线，请进行取色后重试！', QMessageBox.Ok)
+        else:
+            # 边界线图像与原图分辨率不同时，将掩膜缩放到原图大小
+            villageMask = resize_mask(villageMask, self.originalImg.shape)
+            self.villageOutline = PackedMask.from_array(villageMask)
+            self.show_village()
+
+    def show_village(self):
+        """
+        在后台计算村落掩膜，并将掩膜与原图融合后显示
+        """
+        def blend(task):
+            villageMask = self.villageMask
+            task.check()
+            image = np.array(self.originalImg, dtype=np.uint8)
+            return image_blend(image, villageMask.unpack(), 1, 0.6, 0)
+        self.run_task('正在提取村落区域', blend, finished=self.show_image)
 
     def medaxis(self):
         """
         中轴变换
         """
-        self.eventType = EventType.noneType
-        # 判断是否已经有结果，如果有则直接加载
-        if self.midAxis is None:
-            if self.villageMask is None:
-                # 未找到村落区域，则加载原图
-                self.label_show(self.originalImg)
-                QMessageBox.warning(self, '提示', '未找到村落区域！', QMessageBox.Ok)
-            else:
-                skel, distance = medial_axis(self.villageMask, return_distance=True)
-                dist_on_skel = distance * skel
-                # 动态显示
-                result = self.dynamic_showResult(dist_on_skel)
-                self.midAxis = result
-        else:
-            self.label_show(self.midAxis)
-            self.resultImg = self.midAxis
+        self.show_skeleton('medaxis')
 
     def skletonize1(self):
         """
         图像细化算法
         """
-        self.eventType = EventType.noneType
-        # 判断是否已经有结果，如果有则直接加载
-        if self.sk1 is None:
-            if self.villageMask is None:
-                # 未找到村落区域，则加载原图
-                self.label_show(self.originalImg)
-                QMessageBox.warning(self, '提示', '未找到村落区域！', QMessageBox.Ok)
-            else:
-                skeleton = skeletonize(self.villageMask)
-                # 动态显示
-                result = self.dynamic_showResult(skeleton)
-                self.sk1 = result
-        else:
-            self.label_show(self.sk1)
-            self.resultImg = self.sk1
+        self.show_skeleton('skeletonize')
             
     def skletonize2(self):
         """
         三维图像细化
         """
+        self.show_skeleton('lee')
+
+    def show_skeleton(self, method):
+        """
+        提取并显示骨架，已有结果时直接加载，否则动态显示提取过程
+        """
         self.eventType = EventType.noneType
-        # 判断是否已经有结果，如果有则直接加载
-        if self.sk2 is None:
-            if self.villageMask is None:
-                # 未找到村落区域，则加载原图
-                self.label_show(self.originalImg)
-                QMessageBox.warning(self, '提示', '未找到村落区域！', QMessageBox.Ok)
-            else:
-                skeleton_lee = skeletonize(self.villageMask, method='lee')
-                # 动态显示
-                result = self.dynamic_showResult(skeleton_lee)
-                self.sk2 = result
+        self.skeletonMethod = method
+        result = self.pipeline.cached('result:' + method)
+        if result is None:
+            # 在后台提取骨架并逐帧发送，动态显示，最后一帧即为结果
+            shape = self.originalImg.shape
+            self.run_task('正在提取骨架', self.dynamic_showResult, method, self.view.frame_size(shape),
+                          finished=lambda result: self.skeleton_extracted(method, result),
+                          frame=lambda frame: self.view.show_frame(frame, shape))
         else:
-            self.label_show(self.sk2)
-            self.resultImg = self.sk2
+            self.skeleton_extracted(method, result)
 
-    def label_show(self, image):
+    def skeleton_extracted(self, method, result):
         """
-        将image显示在label中，保留图片的长宽比
+        骨架提取完成，保存并显示结果
         """
-        pixmap = pil2pixmap(image)
-        self.label.setPixmap(pixmap.scaled(self.label.size(), aspectRatioMode=Qt.KeepAspectRatio, transformMode = Qt.SmoothTransformation))
-        self.showing_pixmap = pixmap
+        if result is None:
+            # 未找到村落区域，则加载原图
+            self.show_image(self.originalImg)
+            QMessageBox.warning(self, '提示', '未找到村落区域！', QMessageBox.Ok)
+            return
+        self.pipeline.put('result:' + method, result)
+        self.show_image(result)
+        self.resultImg = result
 
-    def dynamic_showResult(self, skeleton):
+    def show_image(self, image):
         """
-        将提取结果进行动态显示
+        显示图像，保留图片的长宽比，可缩放和平移
         """
-        image_list = dilate_iter(skeleton, self.villageMask, self.iterNum, self.kernelSize, self.axisWidth)
-        for im in image_list:
-            image = np.array(self.originalImg, dtype=np.uint8)
-            result = img_addition(image, im, self.axisColor)
-            result = image_blend(result, self.villageMask, 1, 0.6, 0)
-            result = Image.fromarray(result)
-            self.label_show(result)
-            QApplication.processEvents()
+        self.view.set_image(image)
+
+    def skeleton_frames(self, skeletonGraph, originalImg, villageMask, iterNum, kernelSize, axisWidth, axisColor):
+        """
+        骨架线逐步膨胀的结果图像序列
+        """
+        villageMask = villageMask.unpack()
+        image_list = dilate_iter(skeletonGraph.rasterize(), villageMask, iterNum, kernelSize, axisWidth)
+        return composite_frames(originalImg, villageMask, image_list, axisColor)
+
+    def render_skeleton(self, *args):
+        """
+        不做动态显示，直接得到骨架提取的结果图像
+        """
+        canvas = None
+        for canvas in self.skeleton_frames(*args):
+            pass
+        return canvas
+
+    def dynamic_showResult(self, task, method, frameSize):
+        """
+        后台任务：提取骨架并逐帧合成结果图像，每一帧只重绘变化的像素，
+        按显示大小缩小后发送给界面线程进行动态显示
+
+        Parameters
+        ----------
+        task: Task
+            当前任务
+        method: str
+            骨架提取方法
+        frameSize: tuple
+            动态显示时的显示大小 (w, h)
+
+        Return
+        ------
+        canvas: ndarray
+            最后一帧，即结果图像，未找到村落区域时为None
+        """
+        villageMask = self.villageMask
+        if villageMask is None:
+            return None
+        skeletonGraph = self.pipeline.get('graph:' + method)
+        frames = self.skeleton_frames(skeletonGraph, self.originalImg, villageMask,
+                                      self.iterNum, self.kernelSize, self.axisWidth, self.axisColor)
+        total = self.iterNum + 2
+        canvas = None
+        for i, canvas in enumerate(frames):
+            task.report(i + 1, total)
+            if frameSize == tuple(canvas.shape[1::-1]):
+                frame = canvas.copy()
+            else:
+                frame = cv2.resize(canvas, frameSize, interpolation=cv2.INTER_NEAREST)
+            task.emit_frame(frame)
+            # 控制动态显示的速度，只暂停后台线程
             time.sleep(self.sleepTime)
-        self.resultImg = result
-        self.skPix = pil2pixmap(result)
-        return result
+        return canvas
+
+    def run_task(self, message, func, *args, finished=None, frame=None):
+        """
+        在后台线程中执行 func(task, *args)，正在执行的任务被取消
+
+        Parameters
+        ----------
+        message: str
+            状态栏中显示的说明
+        finished: callable, optional
+            finished(result)，在界面线程中处理结果
+        frame: callable, optional
+            frame(frame)，在界面线程中处理中间结果
+        """
+        self.cancel_task()
+        task = Task(func, *args)
+        def on_finished(result):
+            if self.task_done(task) and finished is not None:
+                finished(result)
+        def on_failed(e):
+            if self.task_done(task):
+                QMessageBox.warning(self, '提示', '未知错误\n{}'.format(e), QMessageBox.Ok)
+        def on_cancelled():
+            if self.task_done(task):
+                self.statusbar.showMessage('已取消', 3000)
+        def on_progress(done, total):
+            if task is self.task:
+                self.progressBar.setRange(0, total)
+                self.progressBar.setValue(done)
+        def on_frame(value):
+            if task is self.task:
+                frame(value)
+        task.signals.progress.connect(on_progress)
+        task.signals.finished.connect(on_finished)
+        task.signals.failed.connect(on_failed)
+        task.signals.cancelled.connect(on_cancelled)
+        if frame is not None:
+            task.signals.frame.connect(on_frame)
+        self.task = task
+        self.statusbar.showMessage(message)
+        self.progressBar.setRange(0, 0)     # 进度未知时显示忙碌状态
+        self.progressBar.show()
+        self.cancelButton.show()
+        self.threadPool.start(task)
+
+    def task_done(self, task):
+        """
+        任务结束，恢复状态栏
+
+        Return
+        ------
+        current: bool
+            是否为当前任务，被新任务替代的旧任务的结果不再处理
+        """
+        if task is not self.task:
+            return False
+        self.task = None
+        self.statusbar.clearMessage()
+        self.progressBar.hide()
+        self.cancelButton.hide()
+        return True
+
+    def cancel_task(self):
+        """
+        取消正在执行的后台任务
+        """
+        if self.task is not None:
+            self.task.cancel()
         
     def drow_road(self):
         """
         道路绘制
         """
         # 需要先提取出村落的骨架线
-        if self.skPix is None:
+        result = None if self.skeletonMethod is None else self.pipeline.cached('result:' + self.skeletonMethod)
+        if result is None:
             QMessageBox.warning(self, '提示', '请先提取骨架线！', QMessageBox.Ok)
         else:
             try:
                 self.eventType = EventType.drawRoad
-                # 保存道路线
-                self.roadPoints = [[]]
-                # 道路数量
-                self.roadNum = 0
-                self.roadlastPoint = QPoint()
-                self.roadendPoint = QPoint()
-                self.originalImg = self.originalImg.resize((self.label.width(), self.label.height()))
-                self.roadPix = self.skPix.copy()
+                self.outlineLayer.clear()
+                self.roadLayer.clear()
+                self.show_image(result)
             except Exception as e:
                 QMessageBox.warning(self, '提示', '未知错误！', QMessageBox.Ok)
                 
     def offset_calculate(self):
         """
-        偏移度计算
+        偏移度计算，骨架图未计算时先在后台计算
         """
         self.eventType = EventType.noneType
-        try:
-            # 移除道路线中的空列表
-            while [] in self.roadPoints:
-                self.roadPoints.remove([])
-            # 将道路数据转为ndarray
-            for idx, val in enumerate(self.roadPoints):
-                self.roadPoints[idx] = np.array(val)
-            # if len(self.contourPoints) != len(self.roadPoints):
-            #     QMessageBox.warning(self, '提示', '区域数不一致，\n请清空标记后重新绘制道路！', QMessageBox.Ok)
-            result = ['第{}个区域的偏移度是     ;\n'.format(i+1) for i in range(len(self.roadPoints))]
+        roads = self.roadLayer.polylines()
+        def measure(task):
+            calculator = self.offsetCalculator
+            if calculator is None:
+                return None
+            return [self.format_offset(calculator, road) for road in roads]
+        def show_result(offsets):
+            if offsets is None:
+                QMessageBox.warning(self, '提示', '请先提取骨架！', QMessageBox.Ok)
+                return
             result_str = ''
-            for i in range(len(result)):
-                result_str = result_str + str(result[i])
+            for i, offset in enumerate(offsets):
+                result_str = result_str + '第{}个区域的偏移度是 {};\n'.format(i+1, offset)
             QMessageBox.information(self, '计算结果', result_str, QMessageBox.Ok)
-        except Exception as e:
-            QMessageBox.warning(self, '提示', '未知错误', QMessageBox.Ok)
-            print(e)
+        self.run_task('正在计算偏移度', measure, finished=show_result)
 
-    def transPos(self, event):
+    def format_offset(self, calculator, road):
         """
-        将窗体中鼠标点的相对位置转为图像中的相对位置
+        计算一条道路的偏移度，并转为显示用的字符串
         """
-        pos_x = event.pos().x() - self.label.x() - self.centralwidget.x()
-        pos_y = event.pos().y() - self.label.y() - self.centralwidget.y()
-        return QPoint(pos_x, pos_y)
+        res = calculator.measure(road, self.offsetTolerance)
+        if res is None:
+            return '无'
+        return '平均{:.2f}米，最大{:.2f}米，豪斯多夫距离{:.2f}米，{:.0%}的道路在{}米以内'.format(
+            res['mean'], res['max'], res['hausdorff'], res['within'], self.offsetTolerance)
+
+    def show_offset(self):
+        """
+        在状态栏中实时显示正在绘制的道路的偏移度，只使用已经计算的骨架图；
+        骨架图被清空(如修改了格网大小)时在后台重新计算，完成后再显示，不阻塞绘制
+        """
+        road = self.roadLayer.current.array()
+        if len(road) == 0 or self.skeletonMethod is None:
+            self.statusbar.clearMessage()
+            return
+        calculator = self.pipeline.cached('offset:' + self.skeletonMethod)
+        if calculator is not None:
+            self.statusbar.showMessage('第{}条道路：{}'.format(self.roadLayer.number + 1,
+                                                          self.format_offset(calculator, road)))
+        elif self.task is None:
+            # 不取消正在执行的任务，任务完成后的下一次绘制再显示
+            self.run_task('正在准备偏移度计算', lambda task: self.offsetCalculator,
+                          finished=lambda calculator: calculator is not None and self.show_offset())
 
     def extractColor(self):
         """
@@ -346,81 +609,70 @@ class AxisTrans(BaseMainWindow, axisTransWindow):
         """
         self.eventType = EventType.extractColor
 
-    def eventFilter(self, source, event) -> bool:
+    def outline_pen(self):
+        """
+        边界线样式，线宽不随缩放变化
+        """
+        pen = QPen(self.contourPenCol, 2, Qt.DashLine)
+        pen.setCosmetic(True)
+        return pen
+
+    def road_pen(self):
         """
-        lsbel resize事件
+        道路线样式
+        """
+        pen = QPen(self.roadPenCol, 5, Qt.SolidLine)
+        pen.setCosmetic(True)
+        return pen
+
+    def drawing_layer(self):
         """
-        if (source is self.label and event.type() == QtCore.QEvent.Resize):
-        # re-scale the pixmap when the label resizes
-            if self.showing_pixmap is not None:
-                self.label.setPixmap(self.showing_pixmap.scaled(
-                    self.label.size(), QtCore.Qt.KeepAspectRatio,
-                    QtCore.Qt.SmoothTransformation))
-        return super(AxisTrans, self).eventFilter(source, event)
+        当前正在绘制的线条图层，不在绘制状态时为None
+        """
+        if self.eventType == EventType.drawOutline:
+            return self.outlineLayer
+        elif self.eventType == EventType.drawRoad:
+            return self.roadLayer
+        return None
 
-    def mousePressEvent(self, event) :
+    def image_pressed(self, pos, button):
         """
         鼠标事件，根据不同的类型执行不同事件
+
+        Parameters
+        ----------
+        pos: QPointF
+            原始分辨率的图像坐标
+        button: Qt.MouseButton
+            鼠标按键
         """
+        # 像素i覆盖场景坐标[i, i+1)，向下取整得到所在像素
+        point = (math.floor(pos.x()), math.floor(pos.y()))
         # 绘制村落边界线
         if self.eventType == EventType.drawOutline:
-            if event.button() == Qt.LeftButton:
-                # 鼠标左键绘制线条
-                if self.lastPoint == QPoint() and self.endPoint== QPoint():
-                    # 如果将要绘制一条新的线条，在contourPoints中添加一个新列表，将后续点的坐标保存在这个新列表中
-                    self.lastPoint = self.transPos(event)       # 新线条
-                    point_np = np.array([self.lastPoint.x(), self.lastPoint.y()])
-                    self.contourPoints[self.contourNum].append(point_np)
-                    self.endPoint = self.lastPoint
-                else:
-                    self.endPoint = self.transPos(event)
-                    # 每个点是一个（1，2）的ndarray
-                    point_np = np.array([self.endPoint.x(), self.endPoint.y()])
-                    self.contourPoints[self.contourNum].append(point_np)
-                    # 刷新区域，动态显示
-                    self.update()
-            # 鼠标右键负责开始一条新线条的绘制，每点一次就新建一个线条
-            elif event.button() == Qt.RightButton:
-                self.lastPoint = QPoint()
-                self.endPoint = QPoint()
-                # 新建线条列表并将其加入到contourPoints中同时增加线条数
-                self.contourPoints.append([])
-                self.contourNum += 1
-                self.update()
+            if button == Qt.LeftButton:
+                # 鼠标左键在正在绘制的线条末尾添加一个点
+                self.outlineLayer.add_point(point)
+            # 鼠标右键负责开始一条新线条的绘制
+            elif button == Qt.RightButton:
+                self.outlineLayer.new_stroke()
 
         # 道路绘制，同村落边界线绘制相同
         elif self.eventType == EventType.drawRoad:
-            if event.button() == Qt.LeftButton:
-                if self.roadlastPoint == QPoint() and self.roadendPoint== QPoint():
-                    self.roadlastPoint = self.transPos(event)
-                    point_np = np.array([self.roadlastPoint.x(), self.roadlastPoint.y()])
-                    self.roadPoints[self.roadNum].append(point_np)
-                    self.roadendPoint = self.roadlastPoint
-                else:
-                    self.roadendPoint = self.transPos(event)
-                    point_np = np.array([self.roadendPoint.x(), self.roadendPoint.y()])
-                    self.roadPoints[self.roadNum].append(point_np)
-                #进行重新绘制
-                    self.update()
-            elif event.button() == Qt.RightButton:
-                self.roadlastPoint = QPoint()
-                self.roadendPoint = QPoint()
-                self.roadPoints.append([])
-                self.roadNum += 1
-                self.update()
+            if button == Qt.LeftButton:
+                self.roadLayer.add_point(point)
+                self.show_offset()
+            elif button == Qt.RightButton:
+                self.roadLayer.new_stroke()
         # 取色，通过鼠标点击，提取鼠标点位置的颜色
         elif self.eventType == EventType.extractColor:
             try:
-                if event.button() == Qt.LeftButton:
-                    point = self.transPos(event)
-                    image = self.outlineImg.resize((self.label.width(), self.label.height()))
-                    image = np.array(image, dtype=np.uint8)
-                    # 将图片转到hsv空间
-                    im_hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
-                    # 取出鼠标点的三通道值
-                    hsv_h = im_hsv[:, :, 0][point.y(), point.x()]
-                    hsv_s = im_hsv[:, :, 1][point.y(), point.x()]
-                    hsv_v = im_hsv[:, :, 2][point.y(), point.x()]
+                x, y = point
+                height, width = self.outlineImg.shape[:2]
+                if button == Qt.LeftButton and 0 <= x < width and 0 <= y < height:
+                    # 只将鼠标点处的像素转到hsv空间
+                    pixel = np.array(self.outlineImg[y:y + 1, x:x + 1], dtype=np.uint8)
+                    hsv_h, hsv_s, hsv_v = cv2.cvtColor(pixel, cv2.COLOR_RGB2HSV)[0, 0]
                     if (hsv_s>=43 and hsv_s<=255) and (hsv_v>=46 and hsv_v<=255):
                         if (hsv_h >=0 and hsv_h <=10) or (hsv_h >=156 and hsv_h <=180):
                             self.outlineColor = OutlineColor.red
@@ -448,80 +700,57 @@ class AxisTrans(BaseMainWindow, axisTransWindow):
             except Exception as e:
                 print(e)
 
-    def mouseReleaseEvent( self, event):
-        # 鼠标释放事件
-        # 鼠标左键释放
-        if self.eventType == EventType.drawOutline:
-            if event.button() == Qt.LeftButton :
-                self.endPoint = self.transPos(event)
-                #进行重新绘制
-        elif self.eventType == EventType.drawRoad:
-            if event.button() == Qt.LeftButton :
-                self.roadendPoint = self.transPos(event)
+    def cleanLine(self):
+        """
+        清除线条
+        """
+        layer = self.drawing_layer()
+        if layer is not None:
+            layer.clear()
+            if layer is self.roadLayer:
+                self.show_offset()
 
-    def paintEvent(self, event):
+    def undoLine(self):
         """
-        绘制时间
+        撤销上一次绘制的点或新线条
         """
-        if self.eventType == EventType.drawOutline:
-            pp = QPainter(self.outlinePix)
-            pen = QPen(self.contourPenCol, 2, Qt.DashLine) # 定义笔格式对象
-            pp.setPen(pen) #将笔格式赋值给 画笔
-            # 根据鼠标指针前后两个位置绘制直线
-            pp.drawLine(self.lastPoint, self.endPoint)
-            # 让前一个坐标值等于后一个坐标值，
-            # 这样就能实现画出连续的线
-            self.lastPoint = self.endPoint
-            self.label.setPixmap(self.outlinePix)
-        elif self.eventType == EventType.drawRoad:
-            pp = QPainter(self.roadPix)
-            pen = QPen(self.roadPenCol, 5, Qt.SolidLine) # 定义笔格式对象
-            pp.setPen(pen) #将笔格式赋值给 画笔
-            # 根据鼠标指针前后两个位置绘制直线
-            pp.drawLine(self.roadlastPoint, self.roadendPoint)
-            # 让前一个坐标值等于后一个坐标值，
-            # 这样就能实现画出连续的线
-            self.roadlastPoint = self.roadendPoint
-            self.label.setPixmap(self.roadPix)
-
-    def mouseMoveEvent(self, event):
-        # 鼠标左键按下的同时移动鼠标
-        if self.eventType == EventType.drawOutline:
-            if event.button() == Qt.LeftButton:
-                self.endPoint = self.transPos(event)
-                #进行重新绘制
-                self.update()
-        elif self.eventType == EventType.drawRoad:
-            if event.button() == Qt.LeftButton:
-                self.roadendPoint = self.roadtransPos(event)
-                #进行重新绘制
-                self.update()
+        layer = self.drawing_layer()
+        if layer is not None and layer.undo() and layer is self.roadLayer:
+            self.show_offset()
 
-    def cleanLine(self):
+    def redoLine(self):
         """
-        清除线条
+        重做被撤销的点或新线条
         """
-        if self.eventType == EventType.drawOutline:
-            self.contourPoints = [[]]
-            self.contourNum = 0
-            self.outlinePix = pil2pixmap(self.originalImg)
-            self.lastPoint = QPoint()
-            self.endPoint = QPoint()
-            self.update()
-        elif self.eventType == EventType.drawRoad:
-            self.roadPoints = [[]]
-            self.roadNum = 0
-            self.roadPix = self.skPix.copy()
-            self.roadlastPoint = QPoint()
-            self.roadendPoint = QPoint()
-            self.update()
+        layer = self.drawing_layer()
+        if layer is not None and layer.redo() and layer is self.roadLayer:
+            self.show_offset()
+
+    def deleteLine(self):
+        """
+        删除最后一条线条
+        """
+        layer = self.drawing_layer()
+        if layer is not None and layer.delete_stroke() and layer is self.roadLayer:
+            self.show_offset()
     
     def cleanImg(self):
         """
         清空图像
         """
         bg = Image.open('axis_trans/resource/background.jpg')
-        self.label.setPixmap(pil2pixmap(bg))
+        self.outlineLayer.clear()
+        self.roadLayer.clear()
+        self.show_image(np.asarray(bg.convert('RGB')))
+
+    def closeEvent(self, event):
+        """
+        退出前取消后台任务并等待其结束
+        """
+        super(AxisTrans, self).closeEvent(event)
+        if event.isAccepted():
+            self.cancel_task()
+            self.threadPool.waitForDone()
 
     def quit(self):
         """
@@ -538,7 +767,7 @@ class AxisTrans(BaseMainWindow, axisTransWindow):
         else:
             fname, ftype = QFileDialog.getSaveFileName(self, '保存图片', 'function/axis_trans/data/黔东南6个村子宜居区域15度/结果/{}'.format(self.img_name), 'Image files (*.jpg *.png *.jpeg)')
             if fname[0] is not None:
-                self.resultImg.save(fname, quality=95)
+                Image.fromarray(np.asarray(self.resultImg)).save(fname, quality=95)
                 QMessageBox.warning(self, "提示", "保存成功！", QMessageBox.Ok)
             else:
                 QMessageBox.warning(self, "提示", "保存失败，请重试！", QMessageBox.Ok)
@@ -554,11 +783,7 @@ class AxisTrans(BaseMainWindow, axisTransWindow):
         坡度计算
         """
         if self.elevationData is not None:
-            image = np.array(self.elevationData)
-            self.slopeImg = cal_slope(image, self.gradWe, self.gradSn)
-            res = Image.fromarray(self.slopeImg)
-            self.label_show(res)
-            # self.label.setPixmap(pil2pixmap(res))
+            self.run_task('正在计算坡度', lambda task: self.slopeImg, finished=self.show_image)
         else:
             QMessageBox.warning(self, '提示', '未找到高程数据，请先加载数据！', QMessageBox.Ok)
 
@@ -567,10 +792,7 @@ class AxisTrans(BaseMainWindow, axisTransWindow):
         曲率计算
         """
         if self.elevationData is not None:
-            image = np.array(self.elevationData, dtype=np.uint8)
-            res = cal_curvature(image)
-            self.curvatureImg = Image.fromarray(res)
-            self.label.setPixmap(pil2pixmap(self.curvatureImg))
+            self.run_task('正在计算曲率', lambda task: stretch_uint8(self.curvatureImg), finished=self.show_image)
         else:
             QMessageBox.warning(self, '提示', '未找到高程数据，请先加载数据！', QMessageBox.Ok)
 
@@ -578,25 +800,27 @@ class AxisTrans(BaseMainWindow, axisTransWindow):
         """
         根据坡度阈值，划分区域
         """
-        if self.slopeImg is not None:
-            mask = np.zeros_like(self.slopeImg, dtype=np.uint8)
-            mask[self.slopeImg < self.slope_threshold] = 1
-            self.slopeDivided = mask
-            res = image_blend(np.array(self.originalImg), mask, 1, 0.4, 0)
-            res = Image.fromarray(res)
-            self.label.setPixmap(pil2pixmap(res))
+        def blend_overlay(task):
+            blended = self.pipeline.cached('slopeOverlay') is None
+            overlay = self.pipeline.get('slopeOverlay')
+            if blended and overlay is not None:
+                # 融合图像交替使用两个缓冲区，本次写入的缓冲区不在显示中，
+                # 只更新其金字塔中包含变化像素的块
+                self.view.pyramids.update(overlay, self.pipeline.get('slopeThreshold').blendChanged)
+            return overlay
+        def show_overlay(res):
+            if res is None:
+                QMessageBox.warning(self, '提示', '未找到原始图像，请先加载数据！', QMessageBox.Ok)
+            else:
+                self.show_image(res)
+        if self.elevationData is not None:
+            # 划分坡度区域后，村落掩膜才与坡度适宜区求交
+            self.useSlopeMask = True
+            # 坡度图按需计算，坡度阈值改变时只更新变化的像素
+            self.run_task('正在划分坡度区域', blend_overlay, finished=show_overlay)
         else:
-            QMessageBox.warning(self, '提示', '未找到坡度图，请先计算坡度！', QMessageBox.Ok)
+            QMessageBox.warning(self, '提示', '未找到高程数据，请先加载数据！', QMessageBox.Ok)
 
-    def empty_result(self):
-        """
-        清空结果
-        """
-        self.midAxis = None
-        self.im_contour = None
-        self.sk1 = None
-        self.sk2 = None
-    
     def update_parameters(self):
         """
         更新参数
@@ -609,6 +833,8 @@ class AxisTrans(BaseMainWindow, axisTransWindow):
         self.sleepTime = self.paraWindow.sleepTime
         self.contourPenCol = self.paraWindow.contourPenCol
         self.roadPenCol = self.paraWindow.roadPenCol
+        self.outlineLayer.set_pen(self.outline_pen())
+        self.roadLayer.set_pen(self.road_pen())
         self.axisColor = self.paraWindow.axisColor
         self.axisWidth = self.paraWindow.axisWidth
         self.outlineColor = self.paraWindow.outlineColor
@@ -0,0 +1,153 @@
+"""
+惰性求值的流水线依赖图
+
+每个节点声明其输入节点，结果在第一次读取时计算并缓存；
+源节点(数据和参数)改变后只清空其下游节点的缓存，与之无关的结果保持不变；
+计算可以在后台线程中进行，源节点只在界面线程中赋值，计算期间有节点被清空时结果不写入缓存
+"""
+from collections import defaultdict
+
+import numpy as np
+
+
+# 节点未计算的标记，与结果为None区分
+_MISSING = object()
+
+def _same(a, b):
+    """
+    判断新值与旧值是否相同，数组只比较是否为同一对象
+    """
+    if a is b:
+        return True
+    if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+        return False
+    try:
+        return bool(a == b)
+    except Exception:
+        return False
+
+class PipelineGraph(object):
+    """
+    流水线依赖图，源节点通过set赋值，计算节点通过get惰性求值
+    """
+    def __init__(self) -> None:
+        self._funcs = {}        # 节点名 -> 计算函数，源节点为None
+        self._inputs = {}       # 节点名 -> 输入节点名
+        self._optional = {}     # 节点名 -> 可以为None的输入节点名
+        self._gates = {}        # 节点名 -> 开关源节点名
+        self._children = defaultdict(list)      # 节点名 -> 直接依赖它的节点名
+        self._values = {}       # 已计算(或已赋值)的节点结果
+        self._generation = 0    # 每次清空节点时加1，用于丢弃基于旧输入计算的结果
+
+    def source(self, name, value=None):
+        """
+        添加源节点，如输入图像或参数
+        """
+        self._funcs[name] = None
+        self._inputs[name] = ()
+        self._optional[name] = frozenset()
+        self._values[name] = value
+
+    def stage(self, name, func, inputs, optional=(), gate=None):
+        """
+        添加计算节点
+
+        Parameters
+        ----------
+        name: str
+            节点名
+        func: callable
+            以输入节点的结果为参数的计算函数
+        inputs: sequence of str
+            输入节点名，需要先添加；任一输入为None时本节点的结果也为None
+        optional: sequence of str
+            inputs中可以为None的输入，为None时照常计算
+        gate: str, optional
+            作为开关的源节点，需要是inputs的第一个；开关为None时本节点为None，不计算其它输入，
+            其它输入的变化也不再清空本节点和下游节点
+        """
+        if gate is not None and (not inputs or inputs[0] != gate or self._funcs.get(gate, 0) is not None):
+            raise ValueError('开关需要是第一个输入且为源节点：{}'.format(gate))
+        for i in inputs:
+            if i not in self._funcs:
+                raise KeyError('未定义的输入节点：{}'.format(i))
+            self._children[i].append(name)
+        self._funcs[name] = func
+        self._inputs[name] = tuple(inputs)
+        self._optional[name] = frozenset(optional)
+        self._gates[name] = gate
+
+    def set(self, name, value):
+        """
+        为源节点赋值，值发生变化时清空下游节点
+        """
+        if self._funcs[name] is not None:
+            raise ValueError('只能为源节点赋值：{}'.format(name))
+        if _same(self._values.get(name), value):
+            return
+        self.invalidate(name)
+        self._values[name] = value
+
+    def put(self, name, value):
+        """
+        直接写入计算节点的结果，用于在流水线之外得到的结果(如逐帧显示的最后一帧)
+        """
+        self.invalidate(name)
+        self._values[name] = value
+
+    def get(self, name):
+        """
+        读取节点结果，未计算时先计算其输入
+        """
+        # 只查找一次：后台线程计算时，界面线程可能同时清空节点
+        value = self._values.get(name, _MISSING)
+        if value is not _MISSING:
+            return value
+        generation = self._generation
+        args = []
+        for i in self._inputs[name]:
+            value = self.get(i)
+            if value is None and i not in self._optional[name]:
+                return None
+            args.append(value)
+        value = self._funcs[name](*args)
+        if generation == self._generation:
+            self._values[name] = value
+        return value
+
+    def cached(self, name):
+        """
+        读取已计算的结果，不触发计算，未计算时为None
+        """
+        return self._values.get(name)
+
+    def invalidate(self, name):
+        """
+        清空节点的所有下游节点，计算节点本身也被清空
+        """
+        self._generation += 1
+        if self._funcs[name] is not None:
+            self._values.pop(name, None)
+        stack = [(name, child) for child in self._children[name]]
+        visited = set()
+        while stack:
+            parent, child = stack.pop()
+            if child in visited:
+                continue
+            gate = self._gates.get(child)
+            if gate is not None and parent != gate and self._values.get(gate) is None:
+                # 开关关闭时本节点恒为None，与其它输入无关
+                continue
+            visited.add(child)
+            self._values.pop(child, None)
+            stack.extend((child, c) for c in self._children[child])
+
+def node_property(name, doc=None):
+    """
+    将类属性映射到对象的pipeline中的节点，读取时惰性求值，赋值时清空下游节点
+    """
+    def fget(self):
+        return self.pipeline.get(name)
+    def fset(self, value):
+        self.pipeline.set(name, value)
+    return property(fget, fset, doc=doc)
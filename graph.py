@@ -0,0 +1,426 @@
+"""
+骨架的图表示：端点/交叉点作为节点，节点之间的骨架像素链作为边，
+只保存int32坐标和每个点的中轴半径，占用内存与骨架长度相关，与图像大小无关
+"""
+import json
+
+import cv2
+import numpy as np
+from scipy.spatial import cKDTree
+from skimage.morphology import skeletonize
+
+
+# 8邻域偏移
+NEIGHBORS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+
+class SkeletonGraph(object):
+    """
+    骨架图
+
+    Attributes
+    ----------
+    shape: tuple
+        原图大小 (h, w)
+    nodes: ndarray
+        (n, 2) int32，节点坐标 (y, x)
+    nodeRadius: ndarray
+        (n,) float32，节点处的中轴半径
+    nodeDegree: ndarray
+        (n,) int32，节点的度，1为端点，大于2为交叉点
+    edges: ndarray
+        (m, 2) int32，每条边的起止节点编号
+    edgeOffsets: ndarray
+        (m + 1,) int32，第i条边的内部点为points[edgeOffsets[i]:edgeOffsets[i + 1]]
+    points: ndarray
+        (k, 2) int32，所有边的内部点坐标 (y, x)，按边依次排列
+    pointRadius: ndarray
+        (k,) float32，内部点的中轴半径
+    """
+    def __init__(self, shape, nodes, nodeRadius, edges, edgeOffsets, points, pointRadius) -> None:
+        self.shape = tuple(shape)
+        self.nodes = nodes
+        self.nodeRadius = nodeRadius
+        self.edges = edges
+        self.edgeOffsets = edgeOffsets
+        self.points = points
+        self.pointRadius = pointRadius
+        self.nodeDegree = np.bincount(edges.ravel(), minlength=len(nodes)).astype(np.int32)
+        self._indexes = {}
+
+    @classmethod
+    def from_skeleton(cls, skeleton, villageMask=None):
+        """
+        由骨架栅格构建骨架图
+
+        Parameters
+        ----------
+        skeleton: ndarray
+            骨架图，骨架位置大于0；中轴变换的结果(距离值)直接作为中轴半径
+        villageMask: ndarray, optional
+            村落掩膜，骨架不带距离值时用于计算中轴半径，为None时半径为0
+
+        Return
+        ------
+        graph: SkeletonGraph
+        """
+        shape = skeleton.shape
+        ys, xs = np.nonzero(skeleton)
+        if len(ys) == 0:
+            return cls.empty(shape)
+        # 只在骨架的外接矩形内计算，四周留一个像素的背景
+        y0, x0 = ys.min() - 1, xs.min() - 1
+        y1, x1 = ys.max() + 2, xs.max() + 2
+        crop = np.zeros((y1 - y0, x1 - x0), dtype=skeleton.dtype)
+        sy0, sx0 = max(y0, 0), max(x0, 0)
+        crop[sy0 - y0:min(y1, shape[0]) - y0, sx0 - x0:min(x1, shape[1]) - x0] = \
+            skeleton[sy0:min(y1, shape[0]), sx0:min(x1, shape[1])]
+        # 半径
+        if skeleton.dtype.kind == 'f':
+            radius = crop.astype(np.float32)
+        elif villageMask is not None:
+            # 距离变换在整幅掩膜上计算：骨架的外接矩形位于村落内部，不含背景，在其中计算得不到半径
+            mask = (np.asarray(villageMask) > 0).astype(np.uint8)
+            distance = cv2.distanceTransform(mask, cv2.DIST_L2, 5)
+            # 掩膜中没有背景时距离为FLT_MAX，限制在图像对角线长度以内
+            np.minimum(distance, np.hypot(*shape[:2]), out=distance)
+            radius = np.zeros(crop.shape, dtype=np.float32)
+            radius[sy0 - y0:min(y1, shape[0]) - y0, sx0 - x0:min(x1, shape[1]) - x0] = \
+                distance[sy0:min(y1, shape[0]), sx0:min(x1, shape[1])]
+        else:
+            radius = np.zeros(crop.shape, dtype=np.float32)
+        # 细化为8连通的单像素宽骨架，去掉阶梯处多余的像素
+        skel = skeletonize(crop > 0).astype(np.uint8)
+        kernel = np.ones((3, 3), np.float32)
+        kernel[1, 1] = 0
+        degree = cv2.filter2D(skel, cv2.CV_16S, kernel, borderType=cv2.BORDER_CONSTANT) * skel
+        # 度不为2的像素为节点，相邻的节点像素合并为一个节点
+        nodeMask = ((degree != 2) & (skel > 0)).astype(np.uint8)
+        _, nodeLabels = cv2.connectedComponents(nodeMask, connectivity=8, ltype=cv2.CV_32S)
+        nodeLabels -= 1
+        builder = _GraphBuilder(skel, nodeLabels, radius)
+        return builder.build(shape, (y0, x0))
+
+    @classmethod
+    def empty(cls, shape):
+        """
+        空骨架图
+        """
+        return cls(shape, np.zeros((0, 2), np.int32), np.zeros(0, np.float32), np.zeros((0, 2), np.int32),
+                   np.zeros(1, np.int32), np.zeros((0, 2), np.int32), np.zeros(0, np.float32))
+
+    def __len__(self):
+        return len(self.edges)
+
+    def polyline(self, i):
+        """
+        第i条边的折线，包括起止节点
+
+        Return
+        ------
+        polyline: ndarray
+            (p, 2) int32，坐标 (y, x)
+        """
+        start, end = self.edges[i]
+        inner = self.points[self.edgeOffsets[i]:self.edgeOffsets[i + 1]]
+        return np.concatenate([self.nodes[start:start + 1], inner, self.nodes[end:end + 1]])
+
+    def polylines(self):
+        """
+        所有边的折线
+        """
+        return [self.polyline(i) for i in range(len(self))]
+
+    def pixels(self):
+        """
+        骨架上所有点的坐标(节点与边的内部点)
+
+        Return
+        ------
+        pixels: ndarray
+            (n + k, 2) int32，坐标 (y, x)
+        radius: ndarray
+            (n + k,) float32，中轴半径
+        """
+        return np.concatenate([self.nodes, self.points]), np.concatenate([self.nodeRadius, self.pointRadius])
+
+    def pointEdges(self):
+        """
+        pixels()中每个点所属的边，节点取第一条相连的边，孤立节点为-1
+        """
+        nodeEdges = np.full(len(self.nodes), -1, dtype=np.int32)
+        # 倒序赋值，使每个节点保留编号最小的边
+        edgeIds = np.arange(len(self.edges), dtype=np.int32)
+        nodeEdges[self.edges[::-1, 1]] = edgeIds[::-1]
+        nodeEdges[self.edges[::-1, 0]] = edgeIds[::-1]
+        pointEdges = np.repeat(edgeIds, np.diff(self.edgeOffsets))
+        return np.concatenate([nodeEdges, pointEdges])
+
+    def index(self, gradWe=1.0, gradSn=1.0):
+        """
+        获取骨架点的空间索引，同一格网大小只建立一次，随骨架图一起缓存
+
+        Parameters
+        ----------
+        gradWe: float
+            格网宽度，每像素代表的距离，为1时索引使用像素单位
+        gradSn: float
+            格网高度，每像素代表的距离
+
+        Return
+        ------
+        index: SkeletonIndex
+        """
+        key = (float(gradWe), float(gradSn))
+        if key not in self._indexes:
+            self._indexes[key] = SkeletonIndex(self, gradWe, gradSn)
+        return self._indexes[key]
+
+    def rasterize(self, thickness=1):
+        """
+        将骨架图绘制为栅格
+
+        Return
+        ------
+        mask: ndarray
+            uint8，骨架位置为1
+        """
+        mask = np.zeros(self.shape, dtype=np.uint8)
+        self.draw(mask, 1, thickness)
+        return mask
+
+    def draw(self, image, color, thickness=1):
+        """
+        将骨架线绘制到图像上
+
+        Parameters
+        ----------
+        image: ndarray
+            被绘制的图像，原地修改
+        color: tuple or int
+            颜色
+        thickness: int
+            线宽
+        """
+        lines = [p[:, ::-1].reshape(-1, 1, 2) for p in self.polylines()]
+        cv2.polylines(image, lines, False, color, thickness)
+        # 孤立的节点(单个像素)
+        for y, x in self.nodes[self.nodeDegree == 0]:
+            cv2.circle(image, (int(x), int(y)), max(thickness // 2, 0), color, -1)
+        return image
+
+    def to_geojson(self):
+        """
+        导出为GeoJSON FeatureCollection，坐标为像素坐标 (x, y)，每条边为一个LineString
+        """
+        features = []
+        for i in range(len(self)):
+            line = self.polyline(i)
+            start, end = self.edges[i]
+            radius = np.concatenate([self.nodeRadius[start:start + 1],
+                                     self.pointRadius[self.edgeOffsets[i]:self.edgeOffsets[i + 1]],
+                                     self.nodeRadius[end:end + 1]])
+            features.append({
+                'type': 'Feature',
+                'geometry': {'type': 'LineString', 'coordinates': line[:, ::-1].tolist()},
+                'properties': {'start': int(start), 'end': int(end),
+                               'radius': np.round(radius, 2).tolist()},
+            })
+        return {'type': 'FeatureCollection', 'features': features}
+
+    def save_geojson(self, fname):
+        """
+        保存为GeoJSON文件
+        """
+        with open(fname, 'w', encoding='utf-8') as f:
+            json.dump(self.to_geojson(), f)
+
+    def nbytes(self):
+        """
+        占用的内存大小
+        """
+        return sum(a.nbytes for a in (self.nodes, self.nodeRadius, self.nodeDegree, self.edges,
+                                      self.edgeOffsets, self.points, self.pointRadius))
+
+class SkeletonIndex(object):
+    """
+    骨架点的空间索引(KD树)，用于批量查询任意点到最近骨架线的距离、一定范围内的骨架点，
+    以及点击位置所在的骨架分支
+
+    查询点与返回的距离都按格网大小换算，输入点为图像坐标 (x, y)
+    """
+    def __init__(self, graph, gradWe=1.0, gradSn=1.0) -> None:
+        """
+        Parameters
+        ----------
+        graph: SkeletonGraph
+            骨架图
+        gradWe, gradSn: float
+            格网宽度和高度
+        """
+        pixels, radius = graph.pixels()
+        edges = graph.pointEdges()
+        self.scale = np.array([gradWe, gradSn], dtype=np.float64)
+        self.pixels = pixels            # 骨架点坐标 (y, x)
+        self.radius = radius            # 中轴半径（像素）
+        self.pointEdges = edges         # 骨架点所属的边
+        self.points = pixels[:, ::-1] * self.scale      # 换算后的坐标 (x, y)
+        self.tree = cKDTree(self.points) if len(self.points) else None
+
+    def __len__(self):
+        return len(self.points)
+
+    def nearest(self, points, k=1):
+        """
+        批量查询最近的骨架点
+
+        Parameters
+        ----------
+        points: ndarray
+            (n, 2) 图像坐标 (x, y)
+        k: int
+            返回最近的k个点
+
+        Return
+        ------
+        distance: ndarray
+            到最近骨架点的距离(按格网大小换算)，没有骨架时为inf
+        index: ndarray
+            最近骨架点在self.pixels中的下标，没有骨架时为len(self)
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2) * self.scale
+        if self.tree is None:
+            shape = (len(points),) if k == 1 else (len(points), k)
+            return np.full(shape, np.inf), np.full(shape, len(self), dtype=np.int64)
+        return self.tree.query(points, k=k)
+
+    def within(self, points, r):
+        """
+        批量查询距离r以内的骨架点
+
+        Return
+        ------
+        indexes: list
+            每个查询点对应一个下标数组
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2) * self.scale
+        if self.tree is None:
+            return [np.zeros(0, dtype=np.int64) for _ in range(len(points))]
+        return [np.asarray(i, dtype=np.int64) for i in self.tree.query_ball_point(points, r)]
+
+    def pick_edge(self, point, maxDistance=np.inf):
+        """
+        拾取距离点最近的骨架分支
+
+        Return
+        ------
+        edge: int
+            边的编号，超出maxDistance或没有骨架时为-1
+        """
+        distance, index = self.nearest([point])
+        if not distance[0] <= maxDistance:
+            return -1
+        return int(self.pointEdges[index[0]])
+
+    def subset(self, keep):
+        """
+        只包含部分骨架点的索引，keep为self中各点是否保留的bool数组
+        """
+        index = SkeletonIndex.__new__(SkeletonIndex)
+        index.scale = self.scale
+        index.pixels = self.pixels[keep]
+        index.radius = self.radius[keep]
+        index.pointEdges = self.pointEdges[keep]
+        index.points = self.points[keep]
+        index.tree = cKDTree(index.points) if len(index.points) else None
+        return index
+
+class _GraphBuilder(object):
+    """
+    沿骨架像素链追踪边
+    """
+    def __init__(self, skel, nodeLabels, radius) -> None:
+        self.skel = skel
+        self.nodeLabels = nodeLabels
+        self.radius = radius
+        self.visited = np.zeros(skel.shape, dtype=bool)
+        # 节点坐标取其中半径最大的像素
+        self.nodes = []
+        self.nodeRadius = []
+        ys, xs = np.nonzero(nodeLabels >= 0)
+        labels = nodeLabels[ys, xs]
+        order = np.lexsort((-radius[ys, xs], labels))
+        first = np.unique(labels[order], return_index=True)[1]
+        for i in order[first]:
+            self._add_node(ys[i], xs[i])
+        self.nodePixels = (ys, xs, labels)
+        self.edges = []
+        self.chains = []
+
+    def _add_node(self, y, x):
+        self.nodes.append((y, x))
+        self.nodeRadius.append(self.radius[y, x])
+        return len(self.nodes) - 1
+
+    def _trace(self, startNode, prev, y, x):
+        """
+        从节点startNode的像素prev出发，经过链像素(y, x)追踪到另一个节点
+
+        链像素的度为2，除去来时的像素后只有一个相邻的骨架像素
+        """
+        chain = []
+        while True:
+            self.visited[y, x] = True
+            chain.append((y, x))
+            nextPixel = None
+            for dy, dx in NEIGHBORS:
+                ny, nx = y + dy, x + dx
+                if (ny, nx) != prev and self.skel[ny, nx]:
+                    nextPixel = (ny, nx)
+                    break
+            if nextPixel is None:
+                endNode = startNode
+                break
+            endNode = self.nodeLabels[nextPixel]
+            if endNode >= 0:
+                break
+            prev = (y, x)
+            y, x = nextPixel
+        # 紧贴交叉点的一两个像素会形成回到自身的短环，不是真正的环路
+        if endNode == startNode and len(chain) <= 2:
+            return
+        self.edges.append((startNode, endNode))
+        self.chains.append(chain)
+
+    def build(self, shape, offset):
+        ys, xs, labels = self.nodePixels
+        # 从每个节点像素出发追踪
+        for y, x, label in zip(ys, xs, labels):
+            for dy, dx in NEIGHBORS:
+                ny, nx = y + dy, x + dx
+                if self.skel[ny, nx] and self.nodeLabels[ny, nx] < 0 and not self.visited[ny, nx]:
+                    self._trace(label, (y, x), ny, nx)
+        # 没有节点的闭合环路，任取一个像素作为节点
+        for y, x in zip(*np.nonzero((self.skel > 0) & ~self.visited & (self.nodeLabels < 0))):
+            if self.visited[y, x]:
+                continue
+            self.visited[y, x] = True
+            self.nodeLabels[y, x] = node = self._add_node(y, x)
+            for dy, dx in NEIGHBORS:
+                ny, nx = y + dy, x + dx
+                if self.skel[ny, nx]:
+                    self._trace(node, (y, x), ny, nx)
+                    break
+        oy, ox = offset
+        nodes = np.array(self.nodes, dtype=np.int32).reshape(-1, 2) + np.array([oy, ox], dtype=np.int32)
+        lengths = [len(c) for c in self.chains]
+        edgeOffsets = np.zeros(len(self.chains) + 1, dtype=np.int32)
+        np.cumsum(lengths, out=edgeOffsets[1:])
+        if lengths:
+            points = np.array([p for c in self.chains for p in c], dtype=np.int32)
+            pointRadius = self.radius[points[:, 0], points[:, 1]].astype(np.float32)
+            points += np.array([oy, ox], dtype=np.int32)
+        else:
+            points = np.zeros((0, 2), dtype=np.int32)
+            pointRadius = np.zeros(0, dtype=np.float32)
+        return SkeletonGraph(shape, nodes, np.array(self.nodeRadius, dtype=np.float32),
+                             np.array(self.edges, dtype=np.int32).reshape(-1, 2), edgeOffsets, points, pointRadius)
@@ -0,0 +1,242 @@
+"""
+按位压缩的二值掩膜与掩膜运算，将村落边界、坡度适宜区、水体等二值图层按位压缩后求交、求差，得到最终的村落掩膜
+"""
+import cv2
+import numpy as np
+
+
+def pack_mask(mask):
+    """
+    将二值掩膜按行压缩，每个字节保存8个像素
+
+    Parameters
+    ----------
+    mask: ndarray
+        (h, w) 掩膜，非0为前景
+
+    Return
+    ------
+    packed: ndarray
+        (h, ceil(w/8)) uint8
+    """
+    return np.packbits(np.asarray(mask) > 0, axis=-1)
+
+def unpack_mask(packed, width, out=None):
+    """
+    将压缩的掩膜还原为 (h, width) 的uint8 0/1 掩膜
+    """
+    mask = np.unpackbits(packed, axis=-1, count=width)
+    if out is None:
+        return mask
+    out[...] = mask
+    return out
+
+# 每个字节中1的个数
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+class PackedMask(object):
+    """
+    按位压缩的二值掩膜，每行单独压缩，每个字节保存8个像素，内存为uint8掩膜的1/8
+
+    支持 & | ^ ~ 运算，面积(1的个数)、外接矩形，以及还原为OpenCV使用的uint8掩膜
+    """
+    def __init__(self, packed, width) -> None:
+        """
+        Parameters
+        ----------
+        packed: ndarray
+            (h, ceil(width/8)) uint8，每行末尾多出的位为0
+        width: int
+            掩膜宽度
+        """
+        self.packed = packed
+        self.width = int(width)
+
+    @classmethod
+    def from_array(cls, mask):
+        """
+        压缩 (h, w) 掩膜，非0为前景
+        """
+        if isinstance(mask, PackedMask):
+            return mask
+        return cls(pack_mask(mask), mask.shape[1])
+
+    @classmethod
+    def zeros(cls, shape):
+        return cls(np.zeros((shape[0], (shape[1] + 7) // 8), dtype=np.uint8), shape[1])
+
+    @property
+    def shape(self):
+        return (self.packed.shape[0], self.width)
+
+    @property
+    def nbytes(self):
+        return self.packed.nbytes
+
+    def _tailMask(self):
+        """
+        每行最后一个字节中有效位的掩码，用于取反后清除多出的位
+        """
+        tail = np.full(self.packed.shape[1], 0xFF, dtype=np.uint8)
+        if self.width % 8:
+            tail[-1] = (0xFF << (8 - self.width % 8)) & 0xFF
+        return tail
+
+    def _other(self, other):
+        other = PackedMask.from_array(other)
+        if other.shape != self.shape:
+            raise ValueError('掩膜大小不一致：{} 与 {}'.format(other.shape, self.shape))
+        return other.packed
+
+    def __and__(self, other):
+        return PackedMask(self.packed & self._other(other), self.width)
+
+    def __or__(self, other):
+        return PackedMask(self.packed | self._other(other), self.width)
+
+    def __xor__(self, other):
+        return PackedMask(self.packed ^ self._other(other), self.width)
+
+    def __invert__(self):
+        return PackedMask(~self.packed & self._tailMask(), self.width)
+
+    def __iand__(self, other):
+        self.packed &= self._other(other)
+        return self
+
+    def __ior__(self, other):
+        self.packed |= self._other(other)
+        return self
+
+    def andnot(self, other):
+        """
+        差集 self − other
+        """
+        return PackedMask(self.packed & ~self._other(other), self.width)
+
+    def rows(self, r0, r1):
+        """
+        第r0到r1行组成的掩膜，与原掩膜共享内存
+        """
+        return PackedMask(self.packed[r0:r1], self.width)
+
+    def count(self):
+        """
+        前景像素个数，即面积
+        """
+        return int(_POPCOUNT[self.packed].sum(dtype=np.int64))
+
+    def any(self):
+        return bool(self.packed.any())
+
+    def bbox(self):
+        """
+        前景的外接矩形
+
+        Return
+        ------
+        box: tuple
+            (x, y, w, h)，与cv2.boundingRect相同，没有前景时为None
+        """
+        rows = np.flatnonzero(self.packed.any(axis=1))
+        if len(rows) == 0:
+            return None
+        columns = np.bitwise_or.reduce(self.packed[rows[0]:rows[-1] + 1], axis=0)
+        columns = np.flatnonzero(np.unpackbits(columns, count=self.width))
+        return (int(columns[0]), int(rows[0]), int(columns[-1] - columns[0] + 1), int(rows[-1] - rows[0] + 1))
+
+    def unpack(self, out=None):
+        """
+        还原为 (h, w) 的uint8 0/1 掩膜，结果连续存储，可直接传给OpenCV
+
+        Parameters
+        ----------
+        out: ndarray, optional
+            重复使用的输出数组
+        """
+        return unpack_mask(self.packed, self.width, out)
+
+    def __array__(self, dtype=None, copy=None):
+        mask = self.unpack()
+        return mask if dtype is None else mask.astype(dtype)
+
+    def save(self, path):
+        """
+        保存为npz文件
+        """
+        np.savez_compressed(path, packed=self.packed, width=self.width)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['packed'], int(data['width']))
+
+def resize_mask(mask, shape):
+    """
+    将掩膜按最近邻缩放到shape大小，用于对齐分辨率不同的图层，大小一致时直接返回
+
+    Parameters
+    ----------
+    mask: ndarray or PackedMask
+    shape: tuple
+
+    Return
+    ------
+    mask: ndarray or PackedMask
+        大小不一致时为缩放后的uint8掩膜，压缩的掩膜缩放后重新压缩
+    """
+    if mask.shape[:2] == tuple(shape[:2]):
+        return mask
+    resized = cv2.resize(np.asarray(mask, dtype=np.uint8), (shape[1], shape[0]), interpolation=cv2.INTER_NEAREST)
+    return PackedMask.from_array(resized) if isinstance(mask, PackedMask) else resized
+
+def combine_masks(base, include=(), exclude=(), out=None, blockRows=4096):
+    """
+    掩膜运算：base ∩ include[0] ∩ include[1] ... − exclude[0] − exclude[1] ...
+
+    按行分块，每块的各图层压缩后按字节做与、与非运算，最后只解压一次，
+    内存访问量约为逐像素运算的1/8，峰值内存只与分块大小有关；
+    已经压缩的图层(PackedMask)不再重复压缩
+
+    Parameters
+    ----------
+    base: ndarray, np.memmap or PackedMask
+        (h, w) 村落边界等基础掩膜
+    include: sequence of ndarray or PackedMask
+        求交的图层，如坡度小于阈值的区域
+    exclude: sequence of ndarray or PackedMask
+        求差的图层，如水体
+    out: ndarray, np.memmap or PackedMask, optional
+        (h, w) 输出，为PackedMask时结果保持压缩，为None时新建uint8数组
+    blockRows: int
+        每块的行数
+
+    Return
+    ------
+    out: ndarray or PackedMask
+        uint8 0/1 掩膜或压缩的掩膜
+    """
+    layers = [base] + list(include) + list(exclude)
+    shape = base.shape[:2]
+    for layer in layers:
+        if layer.shape[:2] != shape:
+            raise ValueError('掩膜大小不一致：{} 与 {}'.format(layer.shape[:2], shape))
+    if out is None:
+        out = np.empty(shape, dtype=np.uint8)
+    def rows(layer, r0, r1):
+        if isinstance(layer, PackedMask):
+            return layer.packed[r0:r1]
+        return pack_mask(layer[r0:r1])
+    height, width = shape
+    for r0 in range(0, height, blockRows):
+        r1 = min(r0 + blockRows, height)
+        packed = np.array(rows(base, r0, r1))
+        for layer in include:
+            packed &= rows(layer, r0, r1)
+        for layer in exclude:
+            packed &= ~rows(layer, r0, r1)
+        if isinstance(out, PackedMask):
+            out.packed[r0:r1] = packed
+        else:
+            unpack_mask(packed, width, out[r0:r1])
+    return out
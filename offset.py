@@ -0,0 +1,109 @@
+"""
+道路偏移度计算，度量手绘道路与村落骨架线之间的距离
+"""
+import cv2
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+def sample_polyline(points, step=1.0):
+    """
+    沿折线等间距采样
+
+    Parameters
+    ----------
+    points: ndarray
+        (p, 2) 折线顶点
+    step: float
+        采样间距(像素)
+
+    Return
+    ------
+    samples: ndarray
+        (n, 2) float64 采样点，包括所有顶点
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(points) < 2:
+        return points
+    segments = np.diff(points, axis=0)
+    lengths = np.hypot(segments[:, 0], segments[:, 1])
+    counts = np.maximum(np.ceil(lengths / step).astype(np.int64), 1)
+    # 每段的采样参数t∈[0, 1)，最后补上终点
+    segment = np.repeat(np.arange(len(segments)), counts)
+    t = (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)) / np.repeat(counts, counts)
+    samples = points[segment] + segments[segment] * t[:, None]
+    return np.concatenate([samples, points[-1:]])
+
+class OffsetCalculator(object):
+    """
+    道路偏移度计算，使用骨架图的空间索引，每条道路只需一次批量最近邻查询
+    """
+    def __init__(self, graph, gradWe, gradSn, villageMask=None) -> None:
+        """
+        Parameters
+        ----------
+        graph: SkeletonGraph
+            骨架图
+        gradWe: float
+            格网宽度，每像素代表的距离（单位：米)
+        gradSn: float
+            格网高度，每像素代表的距离（单位：米)
+        villageMask: ndarray, optional
+            村落掩膜，给定时道路只与其所在村落区域内的骨架比较
+        """
+        self.index = graph.index(gradWe, gradSn)
+        self.pointRegions = None
+        self.regionIndexes = {}
+        if villageMask is not None and len(self.index):
+            # 只保留每个骨架点所属的村落区域编号
+            _, labels = cv2.connectedComponents((np.asarray(villageMask) > 0).astype(np.uint8), connectivity=8)
+            self.pointRegions = labels[self.index.pixels[:, 0], self.index.pixels[:, 1]]
+
+    def _region_index(self, nearest):
+        """
+        根据道路采样点最近的骨架点，选择其中最多的村落区域内的骨架点
+        """
+        if self.pointRegions is None:
+            return self.index
+        region = np.bincount(self.pointRegions[nearest]).argmax()
+        if region not in self.regionIndexes:
+            self.regionIndexes[region] = self.index.subset(self.pointRegions == region)
+        return self.regionIndexes[region]
+
+    def measure(self, road, tolerance=5.0):
+        """
+        计算一条道路的偏移度
+
+        Parameters
+        ----------
+        road: ndarray
+            (p, 2) 道路折线顶点，图像坐标 (x, y)
+        tolerance: float
+            距离阈值（单位：米）
+
+        Return
+        ------
+        result: dict
+            mean: 道路到骨架的平均距离（米）
+            max: 道路到骨架的最大距离（米）
+            hausdorff: 道路与其tolerance米缓冲区内的骨架之间的豪斯多夫距离（米）
+            within: 距骨架tolerance米以内的道路所占比例
+            返回None表示道路点数不足或没有骨架
+        """
+        if len(self.index) == 0 or len(road) == 0:
+            return None
+        samples = sample_polyline(road)
+        distance, nearest = self.index.nearest(samples)
+        index = self._region_index(nearest)
+        if index is not self.index:
+            distance, _ = index.nearest(samples)
+        # 道路缓冲区内的骨架点到道路的距离，用于豪斯多夫距离；缓冲区以外的骨架属于其它道路，
+        # 超出距离上限的点返回inf，不参与计算
+        backDistance, _ = cKDTree(samples * index.scale).query(index.points, distance_upper_bound=tolerance)
+        backDistance = backDistance[np.isfinite(backDistance)]
+        return {
+            'mean': float(distance.mean()),
+            'max': float(distance.max()),
+            'hausdorff': float(max(distance.max(), backDistance.max(initial=0))),
+            'within': float((distance <= tolerance).mean()),
+        }
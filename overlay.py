@@ -0,0 +1,176 @@
+"""
+手绘线条的矢量图层，边界线和道路线以折线保存，每条线是场景中的一个路径图形，显示在图像上方
+
+添加一个点只更新所在线条的路径，不重绘底图；支持逐点撤销/重做和删除整条线
+"""
+import numpy as np
+from PyQt5.QtGui import QPainterPath
+from PyQt5.QtWidgets import QGraphicsPathItem
+
+
+class Stroke(object):
+    """
+    一条折线，坐标为原始分辨率的图像坐标
+    """
+    def __init__(self, pen) -> None:
+        self.points = []
+        self.path = QPainterPath()
+        self.item = QGraphicsPathItem()
+        self.item.setPen(pen)
+
+    def append(self, point):
+        if self.points:
+            self.path.lineTo(point[0], point[1])
+        else:
+            self.path.moveTo(point[0], point[1])
+        self.points.append(point)
+        self.item.setPath(self.path)
+
+    def pop(self):
+        """
+        移除最后一个点，并返回该点
+        """
+        point = self.points.pop()
+        self.path = QPainterPath()
+        for i, (x, y) in enumerate(self.points):
+            if i == 0:
+                self.path.moveTo(x, y)
+            else:
+                self.path.lineTo(x, y)
+        self.item.setPath(self.path)
+        return point
+
+    def array(self):
+        """
+        (n, 2) int32 点坐标，可以直接传给cv2.fillPoly
+        """
+        return np.array(self.points, dtype=np.int32).reshape(-1, 2)
+
+class StrokeLayer(object):
+    """
+    一组折线，最后一条为正在绘制的线条
+    """
+    def __init__(self, view, pen) -> None:
+        """
+        Parameters
+        ----------
+        view: ImageView
+            显示线条的图像查看器
+        pen: QPen
+            线条样式
+        """
+        self.view = view
+        self.pen = pen
+        self.strokes = []
+        self.redoStack = []     # 被撤销的操作，('point', 点) 或 ('stroke', None)
+        self._new_stroke()
+
+    def _new_stroke(self):
+        stroke = Stroke(self.pen)
+        self.view.add_item(stroke.item)
+        self.strokes.append(stroke)
+
+    @property
+    def current(self):
+        """
+        正在绘制的线条
+        """
+        return self.strokes[-1]
+
+    @property
+    def number(self):
+        """
+        正在绘制的线条的序号，从0开始
+        """
+        return len(self.strokes) - 1
+
+    def add_point(self, point):
+        """
+        在正在绘制的线条末尾添加一个点
+        """
+        self.redoStack = []
+        self.current.append(point)
+
+    def new_stroke(self):
+        """
+        开始一条新线条，正在绘制的线条为空时不做任何事
+        """
+        if self.current.points:
+            self.redoStack = []
+            self._new_stroke()
+
+    def undo(self):
+        """
+        撤销最后一次操作(添加点或开始新线条)
+
+        Return
+        ------
+        done: bool
+            是否有可以撤销的操作
+        """
+        if not self.current.points:
+            if len(self.strokes) == 1:
+                return False
+            self.view.remove_item(self.strokes.pop().item)
+            self.redoStack.append(('stroke', None))
+        else:
+            self.redoStack.append(('point', self.current.pop()))
+        return True
+
+    def redo(self):
+        """
+        重做最后一次被撤销的操作
+        """
+        if not self.redoStack:
+            return False
+        action, point = self.redoStack.pop()
+        if action == 'stroke':
+            self._new_stroke()
+        else:
+            self.current.append(point)
+        return True
+
+    def delete_stroke(self, index=None):
+        """
+        删除一条线条，默认为最后一条非空的线条
+
+        Return
+        ------
+        done: bool
+            是否删除了线条
+        """
+        if index is None:
+            indices = [i for i, stroke in enumerate(self.strokes) if stroke.points]
+            if not indices:
+                return False
+            index = indices[-1]
+        self.redoStack = []
+        self.view.remove_item(self.strokes.pop(index).item)
+        # 删除后总是以一条空线条作为正在绘制的线条，之后的点不会接到已完成的线条上
+        if not self.strokes or self.current.points:
+            self._new_stroke()
+        return True
+
+    def set_pen(self, pen):
+        """
+        修改所有线条的样式
+        """
+        self.pen = pen
+        for stroke in self.strokes:
+            stroke.item.setPen(pen)
+
+    def polylines(self):
+        """
+        所有非空线条的点坐标列表
+        """
+        return [stroke.array() for stroke in self.strokes if stroke.points]
+
+    def clear(self):
+        """
+        删除所有线条
+        """
+        for stroke in self.strokes:
+            self.view.remove_item(stroke.item)
+        self.strokes = []
+        self.redoStack = []
+        self._new_stroke()
@@ -0,0 +1,96 @@
+"""
+多进程并行工具，进程间通过共享内存传递掩膜、图像等大数组，避免pickle整幅ndarray
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def default_workers():
+    """
+    默认进程数，与cpu核数相同
+    """
+    return os.cpu_count() or 1
+
+def share_array(shape, dtype):
+    """
+    在共享内存中创建数组，由创建者负责释放
+
+    Parameters
+    ----------
+    shape: tuple
+    dtype: numpy dtype
+
+    Return
+    ------
+    shm: SharedMemory
+        共享内存块，使用完后需调用release_array释放
+    spec: tuple
+        (共享内存名, shape, dtype)，可以传给其它进程，通过attach_array取得数组
+    """
+    dtype = np.dtype(dtype)
+    size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    return shm, (shm.name, tuple(shape), dtype.str)
+
+def attach_array(spec):
+    """
+    根据share_array返回的spec连接共享内存，返回零拷贝的ndarray视图
+
+    Return
+    ------
+    shm: SharedMemory
+        数组使用完后需调用shm.close()
+    array: ndarray
+    """
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    return shm, array
+
+def release_array(shm):
+    """
+    释放由share_array创建的共享内存
+    """
+    shm.close()
+    shm.unlink()
+
+def run_parallel(func, jobs, workers=None, executor=None, progress=None):
+    """
+    使用进程池并行执行任务，结果按任务顺序返回
+
+    Parameters
+    ----------
+    func: callable
+        任务函数，必须可以被pickle(模块级函数)
+    jobs: list
+        每个任务的参数元组
+    workers: int, optional
+        进程数，默认为cpu核数
+    executor: ProcessPoolExecutor, optional
+        复用已有的进程池，为None时新建
+    progress: callable, optional
+        progress(已完成, 总数)，每得到一个结果调用一次；抛出异常时取消尚未开始的任务
+
+    Return
+    ------
+    results: list
+        与jobs顺序一致的结果
+    """
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=workers or default_workers()) as pool:
+            return run_parallel(func, jobs, executor=pool, progress=progress)
+    futures = [executor.submit(func, *job) for job in jobs]
+    results = []
+    try:
+        for f in futures:
+            results.append(f.result())
+            if progress is not None:
+                progress(len(results), len(futures))
+    except BaseException:
+        for f in futures:
+            f.cancel()
+        raise
+    return results
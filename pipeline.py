@@ -0,0 +1,250 @@
+import cv2
+import numpy as np
+from skimage.morphology import medial_axis, skeletonize
+from algorithm import *
+from parallel import run_parallel, default_workers
+from graph import SkeletonGraph
+
+
+# 骨架提取方法，与界面中的“骨架提取1/2/3”对应
+SKELETON_METHODS = ('medaxis', 'skeletonize', 'lee')
+
+def extract_village_mask(outlineImage, outlineColor):
+    """
+    根据边界线图像提取村落掩膜
+
+    Parameters
+    ----------
+    outlineImage: ndarray
+        带有边界线的rgb图像
+    outlineColor: enum
+        边界线的颜色
+
+    Return
+    ------
+    villageMask: ndarray
+        村落掩膜，村落区域为1，背景为0；未找到轮廓线时为None
+    contours: list
+        cv2.findContours找到的外轮廓
+    """
+    return fill_outline(getOutlineMask(outlineImage, outlineColor))
+
+def fill_outline(outlineMask):
+    """
+    查找轮廓线的外轮廓并填充，得到去噪后的区域掩膜
+
+    Return
+    ------
+    regionMask: ndarray
+        区域掩膜，区域内为1，背景为0；未找到轮廓线时为None
+    contours: list
+        cv2.findContours找到的外轮廓
+    """
+    contours, _ = cv2.findContours(outlineMask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+    if len(contours) == 0:
+        return None, contours
+    # 填充轮廓
+    regionMask = np.zeros(outlineMask.shape, dtype=np.uint8)
+    cv2.drawContours(regionMask, contours, -1, 1, -1)
+    return denoise_mask(regionMask), contours
+
+def extract_region_labels(outlineImage, outlineColors):
+    """
+    一次hsv转换提取多种颜色的边界线(如村落、山体、水体)，得到各类区域的标记图
+
+    Parameters
+    ----------
+    outlineImage: ndarray
+        带有边界线的rgb图像
+    outlineColors: list
+        边界线颜色列表
+
+    Return
+    ------
+    labels: ndarray
+        uint8标记图，像素值为所属区域边界线颜色的OutlineColor.value，背景为0；
+        区域重叠时，列表中靠后的颜色覆盖靠前的颜色
+    contours: dict
+        {颜色: 该颜色边界线的外轮廓列表}，未找到的颜色对应空列表
+    """
+    labels = np.zeros(outlineImage.shape[:2], dtype=np.uint8)
+    contours = {}
+    for color, outlineMask in getOutlineMasks(outlineImage, outlineColors).items():
+        regionMask, contours[color] = fill_outline(outlineMask)
+        if regionMask is not None:
+            labels[regionMask > 0] = color.value
+    return labels, contours
+
+def extract_region_skeletons(labels, outlineColors, method='medaxis', workers=1):
+    """
+    对标记图中的每一类区域分别提取骨架
+
+    Return
+    ------
+    skeletons: dict
+        {颜色: 骨架图}，标记图中不存在的颜色不包含在内
+    """
+    skeletons = {}
+    for color in outlineColors:
+        regionMask = (labels == color.value).astype(np.uint8)
+        if regionMask.any():
+            skeletons[color] = extract_skeleton_by_component(regionMask, method, workers)
+    return skeletons
+
+def denoise_mask(villageMask, kernelSize=9):
+    """
+    开运算消除村落掩膜中的噪点
+    """
+    kernel = np.ones((kernelSize, kernelSize), np.uint8)
+    villageMask = cv2.erode(villageMask, kernel)
+    return cv2.dilate(villageMask, kernel)
+
+def extract_skeleton(villageMask, method='medaxis'):
+    """
+    提取村落掩膜的骨架
+
+    Parameters
+    ----------
+    villageMask: ndarray
+        村落掩膜
+    method: {'medaxis', 'skeletonize', 'lee'}
+        medaxis为中轴变换，结果为骨架上的距离值
+        skeletonize为图像细化算法
+        lee为三维图像细化算法
+
+    Return
+    ------
+    skeleton: ndarray
+        骨架图，骨架位置大于0
+    """
+    if method == 'medaxis':
+        skel, distance = medial_axis(villageMask, return_distance=True)
+        return distance * skel
+    elif method == 'skeletonize':
+        return skeletonize(villageMask)
+    elif method == 'lee':
+        return skeletonize(villageMask, method='lee')
+    raise ValueError('未知的骨架提取方法：{}'.format(method))
+
+def _component_skeleton(crop, method):
+    """
+    进程池任务：提取单个连通区域裁剪块的骨架
+    """
+    return extract_skeleton(crop, method)
+
+def extract_skeleton_by_component(villageMask, method='medaxis', workers=1, progress=None):
+    """
+    将村落掩膜按连通区域拆分，在各自的外接矩形内提取骨架后拼接回原图大小，
+    计算量与村落面积相关，而与图像大小无关
+
+    Parameters
+    ----------
+    villageMask: ndarray
+        村落掩膜
+    method: {'medaxis', 'skeletonize', 'lee'}
+        骨架提取方法，同extract_skeleton
+    workers: int
+        并行进程数，为1时在当前进程中依次计算，为None时使用cpu核数
+    progress: callable, optional
+        progress(已完成的区域数, 区域总数)，可以抛出异常中止计算
+
+    Return
+    ------
+    skeleton: ndarray
+        与extract_skeleton结果相同类型的骨架图
+    """
+    num, labels, stats, _ = cv2.connectedComponentsWithStats(villageMask.astype(np.uint8), connectivity=8)
+    skeleton = np.zeros(villageMask.shape, dtype=np.float64 if method == 'medaxis' else bool)
+    # 按面积从大到小排列，使大区域先开始计算，均衡各进程负载
+    order = np.argsort(-stats[1:, cv2.CC_STAT_AREA]) + 1
+    boxes, jobs = [], []
+    height, width = villageMask.shape[:2]
+    for i in order:
+        x, y, w, h = stats[i, :4]
+        # 外接矩形四周在原图中多取一个像素的背景(其它区域置0)，在图像边缘处不扩展，
+        # 与整幅计算一样，图像边界不作为背景
+        x0, y0 = max(x - 1, 0), max(y - 1, 0)
+        x1, y1 = min(x + w + 1, width), min(y + h + 1, height)
+        component = labels[y0:y1, x0:x1] == i
+        boxes.append((x0, y0, x1 - x0, y1 - y0, component))
+        jobs.append((component, method))
+    if workers == 1 or len(jobs) <= 1:
+        results = []
+        for job in jobs:
+            results.append(_component_skeleton(*job))
+            if progress is not None:
+                progress(len(results), len(jobs))
+    else:
+        results = run_parallel(_component_skeleton, jobs, min(workers or default_workers(), len(jobs)),
+                               progress=progress)
+    for (x, y, w, h, component), result in zip(boxes, results):
+        # 外接矩形可能与其它区域重叠，只写回本区域内的像素
+        skeleton[y:y + h, x:x + w][component] = result[component]
+    return skeleton
+
+def render_result(image, villageMask, skeleton, axisColor, axisWidth):
+    """
+    将骨架线按照轴线宽度绘制到原图上，并与村落掩膜融合，即动态显示的最后一帧
+
+    Parameters
+    ----------
+    image: ndarray
+        原始rgb图像
+    villageMask: ndarray
+        村落掩膜
+    skeleton: ndarray or SkeletonGraph
+        骨架图，或骨架图的图表示
+    axisColor: tuple
+        轴线颜色，(r, g, b)
+    axisWidth: int
+        轴线宽度
+
+    Return
+    ------
+    result: ndarray
+    """
+    if isinstance(skeleton, SkeletonGraph):
+        skeleton = skeleton.rasterize()
+    kernel = np.ones((axisWidth, axisWidth), np.uint8)
+    axis = cv2.dilate((skeleton > 0).astype(np.uint8), kernel, iterations=1)
+    result = img_addition(np.array(image, dtype=np.uint8), axis, axisColor)
+    return image_blend(result, villageMask, 1, 0.6, 0)
+
+def composite_frames(image, villageMask, frames, axisColor):
+    """
+    动态显示的增量合成，先计算一次原图与村落掩膜的融合结果，之后每一帧只重绘与上一帧相比发生变化的像素
+
+    Parameters
+    ----------
+    image: ndarray
+        原始rgb图像
+    villageMask: ndarray
+        村落掩膜
+    frames: iterable
+        各帧的骨架区域，如dilate_iter的结果
+    axisColor: tuple
+        轴线颜色，(r, g, b)
+
+    Return
+    ------
+    generator of ndarray
+        每一帧的合成结果，始终是同一个数组(原地修改)，与img_addition + image_blend的结果相同
+    """
+    inside = (villageMask > 0).ravel()
+    base = image_blend(np.array(image, dtype=np.uint8), villageMask, 1, 0.6, 0)
+    canvas = base.copy()
+    baseFlat = base.reshape(-1, 3)
+    canvasFlat = canvas.reshape(-1, 3)
+    # 轴线颜色在村落内外融合后的结果
+    colorIn = np.array(axisColor, dtype=np.uint8)
+    colorOut = np.round(np.array(axisColor) * 0.6).astype(np.uint8)
+    previous = np.zeros(inside.shape, dtype=bool)
+    for frame in frames:
+        current = (np.asarray(frame) > 0).ravel()
+        changed = np.flatnonzero(current != previous)
+        added = changed[current[changed]]
+        removed = changed[~current[changed]]
+        canvasFlat[removed] = baseFlat[removed]
+        canvasFlat[added] = np.where(inside[added, None], colorIn, colorOut)
+        previous = current
+        yield canvas
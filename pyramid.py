@@ -0,0 +1,114 @@
+"""
+显示用的图像金字塔，每层宽高为上一层的一半，显示时选择与显示大小最接近的一层，
+缩放和窗口大小改变时不再读取原始分辨率的图像
+"""
+import itertools
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+# 金字塔编号，用于区分不同金字塔的分块缓存
+_pyramidKeys = itertools.count()
+
+def _halve(image):
+    """
+    宽高各缩小一半，2x2像素取平均，奇数边复制最后一行(列)；
+    每个输出像素只与对应的2x2像素有关，因此可以只对局部区域重新计算
+    """
+    image = np.ascontiguousarray(image)
+    height, width = image.shape[:2]
+    if height % 2 or width % 2:
+        image = cv2.copyMakeBorder(image, 0, height % 2, 0, width % 2, cv2.BORDER_REPLICATE)
+    return cv2.resize(image, ((width + 1) // 2, (height + 1) // 2), interpolation=cv2.INTER_AREA)
+
+class ImagePyramid(object):
+    """
+    图像金字塔，第0层为原图(不复制)，之后每层以面积插值缩小一半，直到长边不超过minSize
+    """
+    def __init__(self, image, minSize=256) -> None:
+        self.key = next(_pyramidKeys)
+        image = np.asarray(image)
+        if image.dtype == bool:
+            image = image.view(np.uint8) * np.uint8(255)
+        self.levels = [image]
+        while max(image.shape[:2]) > minSize:
+            image = _halve(image)
+            self.levels.append(image)
+
+    @property
+    def shape(self):
+        return self.levels[0].shape
+
+    def update(self, index, blockSize=256):
+        """
+        原图中index处的像素被原地修改后，只重新计算各层中包含这些像素的块，
+        并更换编号，使查看器中旧的分块缓存失效(只重新加载可见的分块)
+
+        Parameters
+        ----------
+        index: ndarray
+            被修改的像素的一维索引
+        blockSize: int
+            各层中重新计算的块大小
+        """
+        width = self.levels[0].shape[1]
+        rows, columns = np.divmod(np.asarray(index), width)
+        # 第1层中需要重新计算的块
+        blocks = np.unique(np.stack([rows, columns], axis=1) // (2 * blockSize), axis=0)
+        for k in range(1, len(self.levels)):
+            src, dst = self.levels[k - 1], self.levels[k]
+            for by, bx in blocks:
+                y0, x0 = by * blockSize, bx * blockSize
+                dst[y0:y0 + blockSize, x0:x0 + blockSize] = \
+                    _halve(src[2 * y0:2 * (y0 + blockSize), 2 * x0:2 * (x0 + blockSize)])
+            blocks = np.unique(blocks // 2, axis=0)
+        self.key = next(_pyramidKeys)
+
+class PyramidCache(object):
+    """
+    最近显示过的图像的金字塔，以图像对象为键，同一图像只建立一次金字塔；
+    可以在后台线程中更新未在显示的图像的金字塔
+    """
+    def __init__(self, maxItems=4) -> None:
+        self.maxItems = maxItems
+        self._items = OrderedDict()     # id(image) -> (image, pyramid)，保留图像的引用使id不被复用
+        self._lock = threading.Lock()
+
+    def get(self, image):
+        key = id(image)
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key][1]
+        pyramid = ImagePyramid(image)
+        with self._lock:
+            self._items[key] = (image, pyramid)
+            while len(self._items) > self.maxItems:
+                self._items.popitem(last=False)
+        return pyramid
+
+    def update(self, image, index):
+        """
+        图像中index处的像素被原地修改后，局部更新已建立的金字塔；index为None时移除金字塔，
+        下次显示时重建。图像不能正在显示，否则分块加载线程可能读到修改中的数据
+        """
+        with self._lock:
+            item = self._items.get(id(image))
+            if item is not None and index is None:
+                del self._items[id(image)]
+        if item is not None and index is not None:
+            item[1].update(index)
+
+    def discard(self, image):
+        """
+        移除图像的金字塔，用于图像被原地修改之后
+        """
+        with self._lock:
+            self._items.pop(id(image), None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
@@ -0,0 +1,285 @@
+"""
+栅格缓存，每个输入图像只解码一次，解码结果保存为.npy文件并以内存映射的方式读取，
+超出容量时按最近使用时间淘汰
+"""
+import hashlib
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+from algorithm import stretch_uint8
+from cache import evict_lru, clear_cache
+
+try:
+    import tifffile
+except ImportError:     # 没有tifffile时TIFF也由PIL解码
+    tifffile = None
+
+
+# 默认缓存目录与容量
+DEFAULT_CACHE_DIR = Path.home() / '.village_skeleton' / 'raster_cache'
+DEFAULT_MAX_BYTES = 8 << 30
+# 图像像素数上限，遥感影像常超过PIL默认的上限(约0.9亿像素警告，1.8亿像素抛出DecompressionBombError)，
+# 所有读取图像的地方都通过open_image打开，在这里统一放宽
+MAX_IMAGE_PIXELS = 1 << 32
+
+def open_image(fname):
+    """
+    打开图像(只读取文件头，不解码)，像素数上限为MAX_IMAGE_PIXELS，超过上限的2倍时仍抛出DecompressionBombError
+
+    Return
+    ------
+    image: PIL.Image.Image
+    """
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    return Image.open(fname)
+
+def image_layout(image, mode=None):
+    """
+    由图像头计算解码(并转换为mode)后数组的形状和类型，不解码图像
+
+    Return
+    ------
+    shape: tuple
+    dtype: np.dtype
+    """
+    probe = np.asarray(Image.new(mode or image.mode, (1, 1)))
+    return (image.height, image.width) + probe.shape[2:], probe.dtype
+
+def read_image(fname, out, mode=None, stripRows=1024):
+    """
+    解码图像写入out(内存映射或共享内存中的数组)，不在内存中保留转换后的完整副本
+
+    TIFF在安装了tifffile且不需要转换模式和类型时逐段直接解码到out中；其它情况由PIL解码，
+    原始数据驻留一份，按stripRows行的条带转换模式后写入
+
+    Parameters
+    ----------
+    out: ndarray
+        形状与image_layout一致的数组，类型不同时写入时转换
+    mode: str, optional
+        PIL图像模式，为None时保持原始模式
+    """
+    image = open_image(fname)
+    if tifffile is not None and image.format == 'TIFF' and mode in (None, image.mode):
+        with tifffile.TiffFile(fname) as tif:
+            page = tif.pages[0]
+            if page.shape == out.shape and page.dtype == out.dtype:
+                image.close()
+                page.asarray(out=out)
+                return out
+    width, height = image.size
+    for y in range(0, height, stripRows):
+        strip = image.crop((0, y, width, min(y + stripRows, height)))
+        if mode is not None and strip.mode != mode:
+            strip = strip.convert(mode)
+        out[y:y + strip.height] = np.asarray(strip)
+    image.close()
+    return out
+
+class TiffWindows(object):
+    """
+    按窗口读取分块(瓦片或条带)压缩的TIFF，切片时只解码与窗口相交的分块，不解码整幅图像，
+    最近解码的分块保留在内存中，总大小不超过cacheBytes
+
+    raster[y0:y1, x0:x1] 返回窗口内的数组，用法与内存映射数组相同
+    """
+    def __init__(self, fname, cacheBytes=256 << 20) -> None:
+        self.tif = tifffile.TiffFile(fname)
+        self.page = self.tif.pages[0]
+        self.shape = self.page.shape
+        self.dtype = self.page.dtype
+        self.segmentShape = self.page.chunks[:2]
+        self.columns = -(-self.shape[1] // self.segmentShape[1])
+        self.cacheBytes = cacheBytes
+        self.segments = OrderedDict()
+        self.segmentBytes = 0
+
+    @staticmethod
+    def supports(page):
+        """
+        page能否按窗口读取：像素交错存储的单层图像，且分为多个分块
+        """
+        return (page.planarconfig == 1 or page.samplesperpixel == 1) and page.imagedepth == 1 \
+            and len(page.dataoffsets) > 1
+
+    def _segment(self, index):
+        segment = self.segments.get(index)
+        if segment is not None:
+            self.segments.move_to_end(index)
+            return segment
+        fh = self.tif.filehandle
+        fh.seek(self.page.dataoffsets[index])
+        segment, _, _ = self.page.decode(fh.read(self.page.databytecounts[index]), index)
+        # (1, 行, 列, 波段)，边缘的瓦片包含图像以外的填充
+        segment = segment.reshape(segment.shape[1:3] + self.shape[2:])
+        self.segments[index] = segment
+        self.segmentBytes += segment.nbytes
+        while self.segmentBytes > self.cacheBytes and len(self.segments) > 1:
+            self.segmentBytes -= self.segments.popitem(last=False)[1].nbytes
+        return segment
+
+    def __getitem__(self, key):
+        rows, cols = key[:2]
+        y0, y1, _ = rows.indices(self.shape[0])
+        x0, x1, _ = cols.indices(self.shape[1])
+        out = np.empty((max(y1 - y0, 0), max(x1 - x0, 0)) + self.shape[2:], dtype=self.dtype)
+        segH, segW = self.segmentShape
+        for r in range(y0 // segH, (y1 - 1) // segH + 1 if y1 > y0 else 0):
+            for c in range(x0 // segW, (x1 - 1) // segW + 1 if x1 > x0 else 0):
+                segment = self._segment(r * self.columns + c)
+                sy0, sy1 = max(y0, r * segH), min(y1, r * segH + segment.shape[0])
+                sx0, sx1 = max(x0, c * segW), min(x1, c * segW + segment.shape[1])
+                out[sy0 - y0:sy1 - y0, sx0 - x0:sx1 - x0] = \
+                    segment[sy0 - r * segH:sy1 - r * segH, sx0 - c * segW:sx1 - c * segW]
+        return out
+
+    def close(self):
+        self.segments.clear()
+        self.tif.close()
+
+class RasterStore(object):
+    """
+    栅格缓存，以 文件路径+文件大小+修改时间+模式 作为键，文件被修改后自动重新解码，
+    旧的缓存不再被访问，最终被淘汰
+    """
+    def __init__(self, cacheDir=None, maxBytes=DEFAULT_MAX_BYTES) -> None:
+        self.cacheDir = Path(cacheDir) if cacheDir is not None else DEFAULT_CACHE_DIR
+        self.maxBytes = maxBytes
+
+    def cache_path(self, fname, mode=None, dtype=None):
+        """
+        获取图像对应的缓存文件路径
+        """
+        fname = Path(fname).resolve()
+        stat = fname.stat()
+        key = '{}|{}|{}|{}'.format(fname, stat.st_size, stat.st_mtime_ns, mode)
+        if dtype is not None:
+            key += '|{}'.format(np.dtype(dtype).str)
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return self.cacheDir / '{}_{}.npy'.format(fname.stem, digest[:16])
+
+    def open(self, fname, mode=None, dtype=None):
+        """
+        打开图像，返回只读的内存映射数组
+
+        Parameters
+        ----------
+        fname: str
+            图像路径，.npy文件直接以内存映射方式打开
+        mode: str, optional
+            PIL图像模式，如'RGB'，为None时保持原始模式(如高程数据的'F'、'I;16')
+        dtype: data-type, optional
+            缓存的数据类型，如高程数据使用float32，为None时保持解码结果的类型
+
+        Return
+        ------
+        raster: np.memmap
+            (h, w) 或 (h, w, c) 的只读数组
+        """
+        if Path(fname).suffix.lower() == '.npy':
+            raster = np.load(fname, mmap_mode='r')
+            if dtype is None or raster.dtype == dtype:
+                return raster
+        path = self.cache_path(fname, mode, dtype)
+        if not path.exists():
+            self._decode(fname, mode, dtype, path)
+        return self._load(path)
+
+    def open_windows(self, fname, mode=None):
+        """
+        以按窗口读取的方式打开大幅栅格，切片时才读取对应的区域，用于分块处理：
+        .npy与未压缩的TIFF以内存映射方式打开，分块压缩的TIFF由TiffWindows按分块解码，
+        不需要转换模式时都不经过缓存；其它图像先逐条带解码到缓存中，再以内存映射方式读取
+
+        Return
+        ------
+        raster: np.memmap or TiffWindows
+            支持raster[y0:y1, x0:x1]切片读取的只读栅格
+        """
+        suffix = Path(fname).suffix.lower()
+        if suffix == '.npy':
+            return self.open(fname, mode)
+        if tifffile is not None and suffix in ('.tif', '.tiff'):
+            with open_image(fname) as image:
+                sameMode = mode in (None, image.mode)
+            if sameMode:
+                with tifffile.TiffFile(fname) as tif:
+                    page = tif.pages[0]
+                    memmappable = page.is_memmappable
+                    windowed = TiffWindows.supports(page)
+                if memmappable:
+                    return tifffile.memmap(fname, mode='r')
+                if windowed:
+                    return TiffWindows(fname)
+        return self.open(fname, mode)
+
+    def preview(self, fname):
+        """
+        获取高程等单波段数据的8位预览图，只用于显示，与原始数据分开缓存
+
+        Return
+        ------
+        preview: np.memmap
+            (h, w) uint8 的只读数组
+        """
+        path = self.cache_path(fname, 'preview')
+        if not path.exists():
+            # 由float32的缓存生成，不再以原始类型重复缓存一份
+            raster = self.open(fname, dtype=np.float32)
+            self._write(path, raster.shape, np.uint8, lambda out: stretch_uint8(raster, out))
+        return self._load(path)
+
+    def _load(self, path):
+        """
+        以内存映射方式读取缓存，并更新访问时间，用于淘汰最久未使用的缓存
+        """
+        os.utime(path)
+        return np.load(path, mmap_mode='r')
+
+    def _decode(self, fname, mode, dtype, path):
+        """
+        解码图像并逐条带写入缓存，像素数上限见open_image
+        """
+        if Path(fname).suffix.lower() == '.npy':
+            data = np.load(fname, mmap_mode='r')
+            def fill(out):
+                out[...] = data
+            self._write(path, data.shape, dtype, fill)
+        else:
+            with open_image(fname) as image:
+                shape, rawDtype = image_layout(image, mode)
+            self._write(path, shape, dtype if dtype is not None else rawDtype,
+                        lambda out: read_image(fname, out, mode))
+
+    def _write(self, path, shape, dtype, fill):
+        """
+        新建缓存文件并由fill写入数据，先写临时文件再重命名，避免中断时留下不完整的缓存
+        """
+        self.cacheDir.mkdir(parents=True, exist_ok=True)
+        tmpPath = path.with_suffix('.tmp.npy')
+        out = np.lib.format.open_memmap(tmpPath, mode='w+', dtype=dtype, shape=shape)
+        fill(out)
+        out.flush()
+        del out
+        os.replace(tmpPath, path)
+        self.evict(keep=[path])
+
+    def evict(self, keep=()):
+        """
+        按最近使用时间淘汰缓存，直到总大小不超过maxBytes
+
+        Parameters
+        ----------
+        keep: iterable of Path
+            不淘汰的缓存文件，如刚写入的文件
+        """
+        evict_lru(self.cacheDir, '*.npy', self.maxBytes, keep)
+
+    def clear(self):
+        """
+        清空缓存
+        """
+        clear_cache(self.cacheDir, '*.npy')
@@ -0,0 +1,217 @@
+"""
+分块骨架提取，用于超出内存的大幅栅格
+
+边界线栅格按块读取，峰值内存只与分块大小有关，与图像大小无关：
+1. 逐块提取边界线，并标记边界线以外的背景连通区域，通过块之间的接缝合并连通区域，
+   与图像边缘连通的背景即为村落以外的区域，其余区域填充为村落
+2. 逐块读取带有重叠边(halo)的村落掩膜，去噪并提取骨架，只写回块的中心区域；
+   村落内切圆半径超过halo的块自动加大halo，避免切割边产生多余的骨架分支
+
+使用方法：
+    python tiled.py 边界线图像 输出目录 [--method medaxis] [--tile-size 2048] [--halo 256]
+"""
+import argparse
+import os
+from pathlib import Path
+
+import cv2
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from pipeline import *
+from raster import RasterStore
+
+
+def iter_tiles(shape, tileSize):
+    """
+    按行遍历分块
+
+    Return
+    ------
+    generator of (行号, 列号, y0, y1, x0, x1)
+    """
+    height, width = shape[:2]
+    for r, y0 in enumerate(range(0, height, tileSize)):
+        for c, x0 in enumerate(range(0, width, tileSize)):
+            yield r, c, y0, min(y0 + tileSize, height), x0, min(x0 + tileSize, width)
+
+def _label_background(outlineRaster, outlineColor, y0, y1, x0, x1):
+    """
+    提取一个分块的边界线，并对背景做4连通标记，边界线像素标记为0
+    """
+    block = np.ascontiguousarray(outlineRaster[y0:y1, x0:x1], dtype=np.uint8)
+    outlineMask = getOutlineMask(block, outlineColor)
+    _, labels = cv2.connectedComponents(1 - outlineMask, connectivity=4, ltype=cv2.CV_32S)
+    return labels
+
+def tiled_fill_outline(outlineRaster, outlineColor, out, tileSize=2048):
+    """
+    分块提取边界线并填充边界线内的区域，与extract_village_mask中外轮廓填充的结果相同(不含去噪)
+
+    Parameters
+    ----------
+    outlineRaster: ndarray, np.memmap or TiffWindows
+        带有边界线的rgb栅格，(h, w, 3)，只按块切片读取
+    outlineColor: enum
+        边界线颜色
+    out: ndarray or np.memmap
+        (h, w) uint8 的输出数组，村落区域为1
+    tileSize: int
+        分块大小
+
+    Return
+    ------
+    found: bool
+        是否找到边界线
+    """
+    height, width = outlineRaster.shape[:2]
+    # 第一遍：逐块标记背景，只保留分块四条边上的标记，用于跨块合并
+    offsets, edges = {}, {}
+    total = 1       # 全局编号0留给边界线像素
+    found = False
+    for r, c, y0, y1, x0, x1 in iter_tiles(outlineRaster.shape, tileSize):
+        labels = _label_background(outlineRaster, outlineColor, y0, y1, x0, x1)
+        found = found or not labels.all()
+        offsets[r, c] = total - 1
+        total += int(labels.max())
+        globalLabels = np.where(labels > 0, labels + offsets[r, c], 0)
+        edges[r, c] = (globalLabels[0].copy(), globalLabels[-1].copy(),
+                       globalLabels[:, 0].copy(), globalLabels[:, -1].copy())
+    if not found:
+        return False
+    # 相邻分块接缝两侧都是背景的像素，属于同一个连通区域
+    pairs = []
+    outside = []
+    for (r, c), (top, bottom, left, right) in edges.items():
+        if (r, c + 1) in edges:
+            pairs.append(np.stack([right, edges[r, c + 1][2]], axis=1))
+        if (r + 1, c) in edges:
+            pairs.append(np.stack([bottom, edges[r + 1, c][0]], axis=1))
+        # 位于图像边缘的背景与图像外部连通
+        if r == 0:
+            outside.append(top)
+        if c == 0:
+            outside.append(left)
+        if (r + 1, c) not in edges:
+            outside.append(bottom)
+        if (r, c + 1) not in edges:
+            outside.append(right)
+    pairs = np.concatenate(pairs) if pairs else np.zeros((0, 2), dtype=np.int32)
+    pairs = pairs[(pairs > 0).all(axis=1)]
+    graph = coo_matrix((np.ones(len(pairs), dtype=np.uint8), (pairs[:, 0], pairs[:, 1])), shape=(total, total))
+    _, component = connected_components(graph, directed=False)
+    outside = np.concatenate(outside)
+    isOutside = np.zeros(component.max() + 1, dtype=bool)
+    isOutside[component[outside[outside > 0]]] = True
+    # 编号0为边界线像素，属于村落
+    isVillage = ~isOutside[component]
+    isVillage[0] = True
+    # 第二遍：重新标记每个分块，根据全局连通关系写出村落掩膜
+    for r, c, y0, y1, x0, x1 in iter_tiles(outlineRaster.shape, tileSize):
+        labels = _label_background(outlineRaster, outlineColor, y0, y1, x0, x1)
+        labels[labels > 0] += offsets[r, c]
+        out[y0:y1, x0:x1] = isVillage[labels]
+    return True
+
+def _block_bounds(shape, y0, y1, x0, x1, halo):
+    """
+    分块向四周扩展halo个像素后的范围，不超出图像
+    """
+    height, width = shape[:2]
+    return max(y0 - halo, 0), min(y1 + halo, height), max(x0 - halo, 0), min(x1 + halo, width)
+
+def tiled_skeleton(filledMask, maskOut, skeletonOut, method='medaxis', tileSize=2048, halo=256):
+    """
+    分块去噪并提取骨架，每块向四周多读取halo个像素，使接缝两侧的骨架保持连续
+
+    分块的切割边不是村落的边界，只有当块中心区域内每个像素到村落边界的距离都小于halo时，
+    切割边才不会影响中心区域的骨架；不满足时该块的halo加倍后重新计算，直到满足或不再有切割边，
+    因此halo小于村落最大内切圆半径时结果仍然正确，只是这些块的内存占用更大
+
+    Parameters
+    ----------
+    filledMask: ndarray or np.memmap
+        tiled_fill_outline得到的村落掩膜
+    maskOut: ndarray or np.memmap
+        去噪后的村落掩膜输出
+    skeletonOut: ndarray or np.memmap
+        骨架输出，中轴变换为距离值，其它方法为0/1
+    method: {'medaxis', 'skeletonize', 'lee'}
+    tileSize: int
+        分块大小
+    halo: int
+        初始的重叠边宽度，需要大于去噪的核大小
+    """
+    shape = filledMask.shape
+    for _, _, y0, y1, x0, x1 in iter_tiles(shape, tileSize):
+        blockHalo = halo
+        while True:
+            hy0, hy1, hx0, hx1 = _block_bounds(shape, y0, y1, x0, x1, blockHalo)
+            block = denoise_mask(np.array(filledMask[hy0:hy1, hx0:hx1], dtype=np.uint8))
+            core = (slice(y0 - hy0, y1 - hy0), slice(x0 - hx0, x1 - hx0))
+            if (hy0, hy1, hx0, hx1) == (0, shape[0], 0, shape[1]):
+                break
+            if not block[core].any():
+                break
+            # cv2.distanceTransform不把块的边缘作为背景，最近的边界在块外时距离不小于halo
+            if cv2.distanceTransform(block, cv2.DIST_L2, 5)[core].max() < blockHalo:
+                break
+            blockHalo *= 2
+        maskOut[y0:y1, x0:x1] = block[core]
+        if not block.any():
+            skeletonOut[y0:y1, x0:x1] = 0
+            continue
+        skeleton = extract_skeleton_by_component(block, method)
+        skeletonOut[y0:y1, x0:x1] = skeleton[core]
+
+def tiled_pipeline(outlineRaster, outlineColor, outputDir, method='medaxis', tileSize=2048, halo=256):
+    """
+    分块执行 边界线提取 -> 村落掩膜 -> 骨架提取，结果以.npy格式保存在输出目录中
+
+    Return
+    ------
+    maskPath, skeletonPath: Path
+        村落掩膜与骨架的保存路径，未找到边界线时为None
+    """
+    outputDir = Path(outputDir)
+    shape = outlineRaster.shape[:2]
+    filledPath = outputDir / 'filled.npy'
+    filled = np.lib.format.open_memmap(filledPath, mode='w+', dtype=np.uint8, shape=shape)
+    try:
+        if not tiled_fill_outline(outlineRaster, outlineColor, filled, tileSize):
+            return None, None
+        maskPath = outputDir / 'mask.npy'
+        skeletonPath = outputDir / '{}.npy'.format(method)
+        mask = np.lib.format.open_memmap(maskPath, mode='w+', dtype=np.uint8, shape=shape)
+        skeleton = np.lib.format.open_memmap(skeletonPath, mode='w+',
+                                             dtype=np.float32 if method == 'medaxis' else np.uint8, shape=shape)
+        tiled_skeleton(filled, mask, skeleton, method, tileSize, halo)
+        mask.flush()
+        skeleton.flush()
+        del mask, skeleton
+        return maskPath, skeletonPath
+    finally:
+        del filled
+        os.remove(filledPath)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='分块村落骨架提取')
+    parser.add_argument('outline', help='带有边界线的图像或.npy栅格，分块TIFF按窗口读取，其它图像经栅格缓存后按内存映射方式读取')
+    parser.add_argument('output_dir', help='输出目录')
+    parser.add_argument('--method', default='medaxis', choices=SKELETON_METHODS, help='骨架提取方法')
+    parser.add_argument('--outline-color', default='red', choices=[c.name for c in OutlineColor],
+                        help='边界线颜色')
+    parser.add_argument('--tile-size', type=int, default=2048, help='分块大小')
+    parser.add_argument('--halo', type=int, default=256, help='初始的分块重叠边宽度，不足时自动加倍')
+    args = parser.parse_args(argv)
+    Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    outlineRaster = RasterStore().open_windows(args.outline, 'RGB')
+    maskPath, skeletonPath = tiled_pipeline(outlineRaster, OutlineColor[args.outline_color], args.output_dir,
+                                            args.method, args.tile_size, args.halo)
+    if maskPath is None:
+        print('未找到轮廓线')
+    else:
+        print('已保存：{}, {}'.format(maskPath, skeletonPath))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+"""
+分块显示的图像查看器，支持滚轮缩放和拖动平移
+
+只加载视口内可见的分块，分块取自图像金字塔中与当前缩放比例对应的一层，在后台线程中转换，
+转换结果保存在LRU缓存中；场景坐标即原始分辨率的图像坐标，鼠标点击以图像坐标发出
+"""
+import math
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from PyQt5.QtCore import Qt, QObject, QPointF, QRunnable, QThreadPool, pyqtSignal
+from PyQt5.QtGui import QPainter, QPixmap, QTransform
+from PyQt5.QtWidgets import QGraphicsScene, QGraphicsView
+
+from func import array2qimage
+from pyramid import PyramidCache
+
+
+class _TileSignals(QObject):
+    """
+    分块加载完成的信号，由后台线程发出，在界面线程中处理
+    """
+    loaded = pyqtSignal(object, object)     # (分块键, QImage)
+
+class _TileLoader(QRunnable):
+    """
+    后台线程任务：从金字塔的一层中切出分块并包装为QImage
+    """
+    def __init__(self, key, level, rect, signals) -> None:
+        super(_TileLoader, self).__init__()
+        self.key = key
+        self.level = level
+        self.rect = rect
+        self.signals = signals
+
+    def run(self):
+        x0, y0, x1, y1 = self.rect
+        tile = np.ascontiguousarray(self.level[y0:y1, x0:x1])
+        self.signals.loaded.emit(self.key, array2qimage(tile))
+
+class ImageView(QGraphicsView):
+    """
+    分块图像查看器，用于替代QLabel显示大幅图像
+    """
+    imagePressed = pyqtSignal(QPointF, object)      # 鼠标按下，(图像坐标, 鼠标按键)
+
+    def __init__(self, parent=None, tileSize=512, maxTiles=256, pyramids=None) -> None:
+        """
+        Parameters
+        ----------
+        tileSize: int
+            分块大小(金字塔各层中的像素数)
+        maxTiles: int
+            分块缓存的最大数量
+        pyramids: PyramidCache, optional
+            图像金字塔缓存
+        """
+        super(ImageView, self).__init__(parent)
+        self.setScene(QGraphicsScene(self))
+        self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
+        self.setResizeAnchor(QGraphicsView.AnchorViewCenter)
+        self.setRenderHint(QPainter.SmoothPixmapTransform)
+        self.setDragMode(QGraphicsView.ScrollHandDrag)
+        self.setBackgroundBrush(Qt.lightGray)
+        self.tileSize = tileSize
+        self.maxTiles = maxTiles
+        self.pyramids = pyramids if pyramids is not None else PyramidCache()
+        self.pyramid = None
+        self.fitted = True          # 是否处于适应窗口大小的缩放状态
+        self.tileCache = OrderedDict()      # 分块键 -> QPixmap
+        self.tileItems = {}         # 分块键 -> 场景中的分块
+        self.pending = set()        # 正在后台加载的分块键
+        self.wanted = set()         # 当前可见的分块键
+        self.overview = None        # 最低分辨率的整幅图像，分块加载完成前作为底图
+        self.frame = None           # 动态显示时的整幅图像
+        self.threadPool = QThreadPool(self)
+        self.threadPool.setMaxThreadCount(max(QThreadPool.globalInstance().maxThreadCount() // 2, 1))
+        self._signals = _TileSignals(self)
+        self._signals.loaded.connect(self._tile_loaded)
+
+    def set_image(self, image):
+        """
+        显示图像，大小与之前的图像相同时保持当前的缩放与位置；图像被原地修改后需要先通过
+        pyramids.update更新金字塔
+
+        Parameters
+        ----------
+        image: ndarray or np.memmap
+            (h, w) 或 (h, w, c) 图像
+        """
+        pyramid = self.pyramids.get(image)
+        resized = self.pyramid is None or self.pyramid.shape[:2] != pyramid.shape[:2]
+        self.pyramid = pyramid
+        self._clear_tiles()
+        self._clear_frame()
+        height, width = pyramid.shape[:2]
+        self.scene().setSceneRect(0, 0, width, height)
+        self.overview = self._add_pixmap(QPixmap.fromImage(array2qimage(pyramid.levels[-1])),
+                                         pyramid.levels[-1], 0, 0, -1)
+        if resized or self.fitted:
+            self.fit_view()
+        self.update_tiles()
+
+    def frame_size(self, shape):
+        """
+        按当前的缩放比例整幅显示 shape 大小的图像时的显示大小 (w, h)，不超过原始大小
+        """
+        height, width = shape[:2]
+        scale = min(self.transform().m11(), 1.0)
+        return (max(int(width * scale), 1), max(int(height * scale), 1))
+
+    def show_frame(self, image, shape=None):
+        """
+        不分块，按当前的显示大小整幅显示一帧图像，用于动态显示
+
+        Parameters
+        ----------
+        image: ndarray
+            一帧图像
+        shape: tuple, optional
+            image已经按frame_size缩小时，原始图像的大小
+        """
+        if shape is None:
+            shape = image.shape
+            size = self.frame_size(shape)
+            if size != tuple(shape[1::-1]):
+                image = cv2.resize(np.asarray(image), size, interpolation=cv2.INTER_NEAREST)
+        pixmap = QPixmap.fromImage(array2qimage(image))
+        if self.frame is None or self.frame.pixmap().size() != pixmap.size():
+            self._clear_frame()
+            self.frame = self._add_pixmap(pixmap, image, 0, 0, 1, shape=shape)
+        else:
+            self.frame.setPixmap(pixmap)
+
+    def fit_view(self):
+        """
+        缩放到整幅图像完整显示在窗口中
+        """
+        self.fitInView(self.scene().sceneRect(), Qt.KeepAspectRatio)
+        self.fitted = True
+        self.update_tiles()
+
+    def image_pos(self, viewPos):
+        """
+        将视口坐标转为原始分辨率的图像坐标
+        """
+        return self.mapToScene(viewPos)
+
+    def add_item(self, item):
+        """
+        在图像上方添加矢量图形(如绘制的边界线)，坐标为图像坐标
+        """
+        item.setZValue(2)
+        self.scene().addItem(item)
+        return item
+
+    def remove_item(self, item):
+        if item.scene() is self.scene():
+            self.scene().removeItem(item)
+
+    def level_index(self):
+        """
+        当前缩放比例对应的金字塔层，该层的分辨率不低于屏幕上的显示分辨率
+        """
+        scale = self.transform().m11()
+        if scale >= 1:
+            return 0
+        return min(int(math.floor(math.log2(1 / scale))), len(self.pyramid.levels) - 1)
+
+    def update_tiles(self):
+        """
+        加载可见区域内的分块，移除不可见的分块
+        """
+        if self.pyramid is None:
+            return
+        index = self.level_index()
+        level = self.pyramid.levels[index]
+        height, width = level.shape[:2]
+        sx = self.pyramid.shape[1] / width
+        sy = self.pyramid.shape[0] / height
+        visible = self.mapToScene(self.viewport().rect()).boundingRect() & self.scene().sceneRect()
+        size = self.tileSize
+        wanted = set()
+        if not visible.isEmpty():
+            tx0, tx1 = int(visible.left() / sx) // size, int(math.ceil(visible.right() / sx)) // size
+            ty0, ty1 = int(visible.top() / sy) // size, int(math.ceil(visible.bottom() / sy)) // size
+            for ty in range(ty0, min(ty1, (height - 1) // size) + 1):
+                for tx in range(tx0, min(tx1, (width - 1) // size) + 1):
+                    wanted.add((self.pyramid.key, index, tx, ty))
+        self.wanted = wanted
+        for key in list(self.tileItems):
+            if key not in wanted:
+                self.scene().removeItem(self.tileItems.pop(key))
+        for key in wanted:
+            if key in self.tileItems:
+                continue
+            if key in self.tileCache:
+                self.tileCache.move_to_end(key)
+                self._show_tile(key, self.tileCache[key])
+            elif key not in self.pending:
+                _, _, tx, ty = key
+                rect = (tx * size, ty * size, min((tx + 1) * size, width), min((ty + 1) * size, height))
+                self.pending.add(key)
+                self.threadPool.start(_TileLoader(key, level, rect, self._signals))
+
+    def _tile_loaded(self, key, qImg):
+        """
+        分块加载完成，转为QPixmap存入缓存，仍然可见时显示
+        """
+        self.pending.discard(key)
+        if self.pyramid is None or key[0] != self.pyramid.key:
+            return
+        pixmap = QPixmap.fromImage(qImg)
+        self.tileCache[key] = pixmap
+        while len(self.tileCache) > self.maxTiles:
+            self.tileCache.popitem(last=False)
+        if key in self.wanted and key not in self.tileItems:
+            self._show_tile(key, pixmap)
+
+    def _show_tile(self, key, pixmap):
+        _, index, tx, ty = key
+        level = self.pyramid.levels[index]
+        self.tileItems[key] = self._add_pixmap(pixmap, level, tx * self.tileSize, ty * self.tileSize, 0)
+
+    def _add_pixmap(self, pixmap, level, x0, y0, z, shape=None):
+        """
+        添加一个来自金字塔某一层的图块，缩放到原始分辨率的图像坐标
+        """
+        shape = self.pyramid.shape if shape is None else shape
+        sx = shape[1] / level.shape[1]
+        sy = shape[0] / level.shape[0]
+        item = self.scene().addPixmap(pixmap)
+        item.setTransformationMode(Qt.SmoothTransformation)
+        item.setShapeMode(item.BoundingRectShape)
+        item.setTransform(QTransform.fromScale(sx, sy))
+        item.setPos(x0 * sx, y0 * sy)
+        item.setZValue(z)
+        return item
+
+    def _clear_tiles(self):
+        for item in self.tileItems.values():
+            self.scene().removeItem(item)
+        self.tileItems.clear()
+        self.wanted = set()
+        if self.overview is not None:
+            self.scene().removeItem(self.overview)
+            self.overview = None
+
+    def _clear_frame(self):
+        if self.frame is not None:
+            self.scene().removeItem(self.frame)
+            self.frame = None
+
+    def wheelEvent(self, event):
+        """
+        滚轮缩放，以鼠标位置为中心
+        """
+        factor = 1.25 ** (event.angleDelta().y() / 120)
+        self.scale(factor, factor)
+        self.fitted = False
+        self.update_tiles()
+
+    def resizeEvent(self, event):
+        super(ImageView, self).resizeEvent(event)
+        if self.fitted and self.pyramid is not None:
+            self.fit_view()
+        else:
+            self.update_tiles()
+
+    def scrollContentsBy(self, dx, dy):
+        super(ImageView, self).scrollContentsBy(dx, dy)
+        self.update_tiles()
+
+    def mousePressEvent(self, event):
+        self.imagePressed.emit(self.image_pos(event.pos()), event.button())
+        super(ImageView, self).mousePressEvent(event)
+
+    def set_drawing(self, drawing):
+        """
+        绘制模式下鼠标拖动不再平移图像
+        """
+        self.setDragMode(QGraphicsView.NoDrag if drawing else QGraphicsView.ScrollHandDrag)
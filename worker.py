@@ -0,0 +1,116 @@
+"""
+后台计算任务，耗时的流水线计算在线程池中执行，不阻塞界面
+
+任务通过信号报告进度、发送中间结果(如动态显示的帧)和最终结果，信号在界面线程中处理；
+取消是协作式的，任务在报告进度或调用check时检查是否已被取消
+"""
+import threading
+
+from PyQt5.QtCore import QObject, QRunnable, pyqtSignal
+
+
+class TaskCancelled(Exception):
+    """
+    任务已被取消
+    """
+
+# 当前线程中正在执行的任务
+_local = threading.local()
+
+def current_task():
+    """
+    当前线程中正在执行的任务，不在任务中时为None
+    """
+    return getattr(_local, 'task', None)
+
+def report_progress(done, total):
+    """
+    报告当前任务的进度，任务已被取消时抛出TaskCancelled；不在任务中时不做任何事，
+    因此可以作为progress参数传给不依赖Qt的计算函数
+    """
+    task = current_task()
+    if task is not None:
+        task.report(done, total)
+
+class TaskSignals(QObject):
+    """
+    任务的信号，在界面线程中创建，由后台线程发出
+    """
+    progress = pyqtSignal(int, int)     # (已完成, 总数)
+    frame = pyqtSignal(object)          # 中间结果
+    finished = pyqtSignal(object)       # 最终结果
+    failed = pyqtSignal(object)         # 异常
+    cancelled = pyqtSignal()
+
+class Task(QRunnable):
+    """
+    后台任务，在线程池中执行 func(task, *args)
+    """
+    def __init__(self, func, *args) -> None:
+        """
+        Parameters
+        ----------
+        func: callable
+            任务函数，第一个参数为任务本身，用于检查取消和发送中间结果
+        """
+        super(Task, self).__init__()
+        self.setAutoDelete(False)
+        self.func = func
+        self.args = args
+        self.signals = TaskSignals()
+        self._cancelled = threading.Event()
+        self._framePending = False      # 上一帧是否还未被界面线程取走
+        self.signals.frame.connect(self._frame_delivered)
+
+    def cancel(self):
+        """
+        请求取消任务，任务在下一次检查时停止
+        """
+        self._cancelled.set()
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def check(self):
+        """
+        任务已被取消时抛出TaskCancelled
+        """
+        if self._cancelled.is_set():
+            raise TaskCancelled()
+
+    def report(self, done, total):
+        self.check()
+        self.signals.progress.emit(int(done), int(total))
+
+    def emit_frame(self, frame):
+        """
+        发送中间结果，界面线程还未取走上一帧时丢弃本帧，避免帧在队列中堆积
+
+        Return
+        ------
+        sent: bool
+            是否已发送
+        """
+        self.check()
+        if self._framePending:
+            return False
+        self._framePending = True
+        self.signals.frame.emit(frame)
+        return True
+
+    def _frame_delivered(self, frame):
+        self._framePending = False
+
+    def run(self):
+        _local.task = self
+        try:
+            self.check()
+            result = self.func(self, *self.args)
+        except TaskCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            self.signals.failed.emit(e)
+        else:
+            self.signals.finished.emit(result)
+        finally:
+            _local.task = None